@@ -0,0 +1,222 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cold build, no-op rebuild, edit-to-servable latency of `mkinx serve`
+and HTTP throughput on a synthetic Home Documentation (see synthetic.py),
+written as JSON so that runs can be compared across commits.
+
+    $ python benchmarks/bench_build.py --projects 10 --modules 20 --pages 50 \
+        --json results.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from shutil import rmtree
+
+import bench_http
+import synthetic
+
+REPO = Path(__file__).resolve().parent.parent
+MKINX = REPO / "bin" / "mkinx"
+
+
+def mkinx(root, *args):
+    """Run a mkinx command in the Home Documentation
+
+    Returns:
+        float: the command's duration in seconds
+    """
+    env = dict(os.environ, PYTHONPATH=str(REPO))
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(MKINX)] + list(args),
+        cwd=str(root),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", path)
+        return connection.getresponse().read()
+    finally:
+        connection.close()
+
+
+def wait_for(port, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            return get(port, "/")
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError("mkinx serve did not start")
+
+
+def edit_latency(root, project, edits, timeout=60):
+    """Time from saving a project's page to `mkinx serve` serving it
+
+    Args:
+        root (pathlib.Path): the built Home Documentation
+        project (str): the project whose first page is edited
+        edits (int): number of successive edits to time
+        timeout (int, optional): Defaults to 60. Seconds to wait for an edit
+
+    Returns:
+        list(float): each edit's latency in seconds
+    """
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(REPO))
+    process = subprocess.Popen(
+        [sys.executable, str(MKINX), "serve", "-s", str(port)],
+        cwd=str(root),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    page = root / project / "source" / (synthetic.page_name(0) + ".rst")
+    url = "/{}/{}.html".format(project, synthetic.page_name(0))
+    latencies = []
+    try:
+        wait_for(port, timeout)
+        # The file watcher is started once the server is up
+        time.sleep(1)
+        for i in range(edits):
+            marker = "benchmarkedit{}".format(i)
+            start = time.perf_counter()
+            with open(page, "a") as f:
+                f.write("\n{}\n".format(marker))
+            while marker.encode() not in get(port, url):
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError("{} was not rebuilt".format(url))
+                time.sleep(0.01)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return latencies
+
+
+def http_throughput(root, concurrency, requests, workers):
+    """bench_http's threaded server on every listed project's pages"""
+    os.chdir(str(root))
+    paths = [p for ps in bench_http.default_paths(root).values() for p in ps]
+    return bench_http.run("threaded", root, paths, concurrency, requests, workers)
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=str(REPO),
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", help="where to generate the Home Documentation")
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--edits", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root or tempfile.mkdtemp(prefix="mkinx-bench-")).resolve()
+    projects = synthetic.generate(root, args.projects, args.modules, args.pages)
+    build = ["build", "-A", "-F", "-j", str(args.jobs)]
+
+    results = {
+        "parameters": {
+            "projects": args.projects,
+            "modules": args.modules,
+            "pages": args.pages,
+            "jobs": args.jobs,
+        },
+        "environment": environment(),
+    }
+    results["cold_build_s"] = mkinx(root, *build)
+    print("cold build        {:>9.3f} s".format(results["cold_build_s"]))
+    results["noop_build_s"] = mkinx(root, *build)
+    print("no-op build       {:>9.3f} s".format(results["noop_build_s"]))
+
+    latencies = edit_latency(root, projects[0], args.edits)
+    results["edit_to_servable_s"] = {"samples": latencies, "median": median(latencies)}
+    print("edit to servable  {:>9.3f} s (median)".format(median(latencies)))
+
+    results["http"] = http_throughput(
+        root, args.concurrency, args.requests, args.workers
+    )
+    print(
+        "http              {rps:>9.0f} req/s  p50 {p50_ms:.2f} ms"
+        "  p99 {p99_ms:.2f} ms".format(**results["http"])
+    )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if not args.root:
+        os.chdir(str(REPO))
+        rmtree(str(root))
+    return results
+
+
+if __name__ == "__main__":
+    main()
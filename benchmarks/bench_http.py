@@ -0,0 +1,181 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Requests/second and latency percentiles of `mkinx serve`'s HTTP server
+under concurrent load, for the Home Documentation and a project's pages.
+
+Run it from (or point it to) a built Home Documentation:
+
+    $ python benchmarks/bench_http.py --root path/to/your_home_documentation
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from http.server import HTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mkinx import server, utils  # noqa: E402
+
+
+class QuietHandler(server.MkinxHTTPHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LegacyHandler(QuietHandler):
+    # The server before MkinxHTTPServer: one request per connection
+    protocol_version = "HTTP/1.0"
+
+
+class LegacyServer(HTTPServer):
+    # The server before MkinxHTTPServer: one request at a time, files read on
+    # each request and no live reload
+    def __init__(self, server_address, handler_class, dir_path, workers=None):
+        super().__init__(server_address, handler_class)
+        self.routes = server.RouteTable(dir_path)
+        self.cache = server.FileCache(0)
+        self.live = None
+
+
+MODES = {
+    "legacy": (LegacyServer, LegacyHandler),
+    "threaded": (server.MkinxHTTPServer, QuietHandler),
+}
+
+
+def default_paths(root):
+    """A page of the home and the index page and a static asset of every
+    listed project"""
+    paths = {"home": ["/"]}
+    for project in sorted(utils.get_listed_projects()):
+        name = project.strip("/")
+        static = root / name / "build" / "html" / "_static"
+        assets = sorted(
+            p for p in static.glob("*") if p.is_file() and p.suffix in {".js", ".css"}
+        )
+        paths[name] = ["/{}/".format(name)] + [
+            "/{}/_static/{}".format(name, p.name) for p in assets[:1]
+        ]
+    return paths
+
+
+def client(port, paths, count, keep_alive, latencies, errors):
+    connection = None
+    for i in range(count):
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+            if not keep_alive or response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            connection = None
+        latencies.append(time.perf_counter() - start)
+
+
+def run(mode, root, paths, concurrency, requests, workers):
+    server_class, handler_class = MODES[mode]
+    httpd = server_class(("127.0.0.1", 0), handler_class, root, workers=workers)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    port = httpd.server_address[1]
+
+    latencies, errors = [], []
+    clients = [
+        threading.Thread(
+            target=client,
+            args=(
+                port,
+                paths,
+                requests // concurrency,
+                mode != "legacy",
+                latencies,
+                errors,
+            ),
+        )
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.perf_counter() - start
+    httpd.shutdown()
+    httpd.server_close()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": len(errors),
+        # Failed requests do not count towards the throughput
+        "rps": (len(latencies) - len(errors)) / elapsed,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=".", help="built Home Documentation")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--modes", nargs="*", default=sorted(MODES))
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).resolve()
+    os.chdir(str(root))
+
+    results = []
+    for target, paths in default_paths(root).items():
+        for mode in args.modes:
+            result = run(
+                mode, root, paths, args.concurrency, args.requests, args.workers
+            )
+            result["target"] = target
+            results.append(result)
+            print(
+                "{target:<20} {mode:<9} {rps:>9.0f} req/s  p50 {p50_ms:>7.2f} ms"
+                "  p99 {p99_ms:>7.2f} ms  errors {errors}".format(**result)
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
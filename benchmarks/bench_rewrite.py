@@ -0,0 +1,124 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Time to apply mkinx's html fixups (home link, offline fonts) to every
+page of a large project, with the streaming rewriter and with the
+previous readlines() implementation.
+
+    $ python benchmarks/bench_rewrite.py --pages 10000
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mkinx import rewrite  # noqa: E402
+from mkinx.conf import NEW_HOME_LINK, TO_REPLACE_WITH_HOME  # noqa: E402
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+  <link rel="stylesheet" href="https://fonts.googleapis.com/css?family=Roboto">
+  <link rel="stylesheet" href="https://fonts.googleapis.com/icon?family=Material+Icons">
+</head>
+<body>
+  <a href="_sources/page.rst.txt" rel="nofollow"> View page source</a>
+{}
+</body>
+</html>
+"""
+
+
+def legacy(path):
+    # Before rewrite.py: overwrite_view_source then update_index_to_offline
+    with open(path, "r") as f:
+        html = f.readlines()
+    for i, l in enumerate(html):
+        if TO_REPLACE_WITH_HOME in l:
+            html[i] = NEW_HOME_LINK
+            break
+    with open(path, "w") as f:
+        f.writelines(html)
+
+    with open(path, "r") as f:
+        lines = f.readlines()
+    new_lines = []
+    for l in lines:
+        if "https://fonts" in l:
+            if "icon" in l:
+                new_lines.append(
+                    '<link rel="stylesheet"'
+                    + " href=/assets/stylesheets/material-style.css>"
+                )
+        else:
+            new_lines.append(l)
+    with open(path, "w") as f:
+        f.writelines(new_lines)
+
+
+def generate(directory, pages, body_lines):
+    body = "\n".join(
+        "  <p>Line {} of the page</p>".format(i) for i in range(body_lines)
+    )
+    paths = []
+    for i in range(pages):
+        path = directory / "page{}.html".format(i)
+        path.write_text(PAGE.format(body))
+        paths.append(str(path))
+    return paths
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--body_lines", type=int, default=200)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {"pages": args.pages}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate(Path(tmp), args.pages, args.body_lines)
+        results["legacy_first_s"] = timed(lambda: [legacy(p) for p in paths])
+        results["legacy_again_s"] = timed(lambda: [legacy(p) for p in paths])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate(Path(tmp), args.pages, args.body_lines)
+        for key in "streaming_first_s", "streaming_again_s":
+            results[key] = timed(
+                lambda: rewrite.rewrite_html_files(paths, home_link=True, offline=True)
+            )
+
+    for key, value in results.items():
+        print("{:<20} {:.3f}".format(key, value) if key != "pages" else value)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Import time of `mkinx` for commands which should start fast, checked
+against a budget with `python -X importtime`. Exits with an error if a
+command goes over budget or imports one of the heavy modules only some
+commands need.
+
+    $ python benchmarks/bench_startup.py --budget 50
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+MKINX = REPO / "bin" / "mkinx"
+
+# Commands and the arguments they are timed with
+COMMANDS = {"version": ["--version"], "clean": [], "help": ["--help"]}
+
+# Only imported by the commands which use them
+HEAVY_MODULES = ["watchdog", "http.server", "socketserver", "sphinx"]
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(command, args):
+    """Run a command with -X importtime
+
+    Returns:
+        tuple: mkinx's cumulative import time in ms and the imported modules
+    """
+    command = [] if command == "help" else [command]
+    with tempfile.TemporaryDirectory() as cwd:
+        # `clean` removes source/ and build/: run it in an empty directory
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", str(MKINX)] + command + args,
+            cwd=cwd,
+            env=dict(os.environ, PYTHONPATH=str(REPO)),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+    total, modules = 0, set()
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        modules.add(name)
+        if not indent and name.split(".")[0] == "mkinx":
+            total += int(cumulative)
+    return total / 1000, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget", type=float, default=50, help="import time budget in ms"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    results, ok = [], True
+    for command, command_args in COMMANDS.items():
+        times, heavy = [], set()
+        for _ in range(args.runs):
+            total, modules = import_times(command, command_args)
+            times.append(total)
+            heavy |= {m for m in HEAVY_MODULES if m in modules}
+        best = min(times)
+        over = best > args.budget
+        ok = ok and not over and not heavy
+        results.append({"command": command, "import_ms": best, "heavy": sorted(heavy)})
+        print(
+            "{:<10} {:>7.1f} ms{}{}".format(
+                command,
+                best,
+                "  OVER BUDGET ({} ms)".format(args.budget) if over else "",
+                "  imports " + ", ".join(sorted(heavy)) if heavy else "",
+            )
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Synthetic Home Documentations, scaled from the `example_project` that
+`mkinx init` ships: N projects, each with a package of M modules (one
+autodoc page each) and K hand-written pages. The output only depends on
+the parameters, so that benchmarks can be compared across commits.
+
+    $ python benchmarks/synthetic.py /tmp/home --projects 10 --modules 20 --pages 50
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from shutil import copyfile, rmtree
+
+INCLUDE = Path(__file__).resolve().parent.parent / "mkinx" / "include"
+TEMPLATE = INCLUDE / "example_project"
+
+MODULE = '''"""
+Module {index} of {package}, generated by benchmarks/synthetic.py
+"""
+'''
+
+FUNCTION = '''
+
+def {name}(source, value):
+    """Search for value in source database ({index})
+
+    Args:
+        source (str): database to look into
+        value (str): value to look for
+
+    Returns:
+        list: occurances found
+    """
+
+    return [source, value, {index}]
+'''
+
+AUTOMODULE = """``{title}``
+{underline}
+
+.. automodule:: {module}
+    :members:
+    :undoc-members:
+    :show-inheritance:
+"""
+
+PAGE = """Page {index}
+{underline}
+
+Hand-written page {index} of {project}, see :doc:`{previous}`.
+
+{paragraphs}
+"""
+
+PARAGRAPH = (
+    "Sphinx reads every source file, resolves its references and writes one "
+    "html page for each of them: paragraph {index} only exists to give it "
+    "some text to index and to search.\n"
+)
+
+INDEX = """Welcome to {project}'s documentation!
+{underline}
+
+.. toctree::
+   :maxdepth: 2
+   :caption: Contents:
+
+   {project}
+{pages}
+
+==================
+
+* :ref:`genindex`
+* :ref:`modindex`
+* :ref:`search`
+"""
+
+
+def project_name(index):
+    return "project_{}".format(index)
+
+
+def page_name(index):
+    return "page_{}".format(index)
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def generate_project(root, project, modules, pages, functions=10):
+    """Write a Sphinx project laid out as `mkinx init`'s example_project
+
+    Args:
+        root (pathlib.Path): the Home Documentation's path
+        project (str): the project's name
+        modules (int): number of modules in the project's package
+        pages (int): number of hand-written pages
+        functions (int, optional): Defaults to 10. Functions per module
+    """
+    project_path = root / project
+    source = project_path / "source"
+    package = project_path / project
+
+    source.mkdir(parents=True)
+    copyfile(str(TEMPLATE / "Makefile"), str(project_path / "Makefile"))
+    with open(TEMPLATE / "source" / "conf.py", "r") as f:
+        conf = f.read()
+    write(source / "conf.py", conf.replace("example_project", project))
+
+    write(package / "__init__.py", MODULE.format(index=0, package=project))
+    names = []
+    for m in range(modules):
+        name = "module_{}".format(m)
+        names.append(name)
+        content = MODULE.format(index=m, package=project)
+        content += "".join(
+            FUNCTION.format(name="function_{}".format(f), index=f)
+            for f in range(functions)
+        )
+        write(package / (name + ".py"), content)
+        module = "{}.{}".format(project, name)
+        write(
+            source / (module + ".rst"),
+            AUTOMODULE.format(
+                title=name, underline="=" * (len(name) + 4), module=module
+            ),
+        )
+
+    toctree = "".join("\n    {}.{}".format(project, n) for n in names)
+    write(
+        source / (project + ".rst"),
+        AUTOMODULE.format(
+            title=project, underline="=" * (len(project) + 4), module=project
+        )
+        + "\nSubmodules\n----------\n\n.. toctree::\n"
+        + toctree
+        + "\n",
+    )
+
+    for p in range(pages):
+        title = "Page {}".format(p)
+        write(
+            source / (page_name(p) + ".rst"),
+            PAGE.format(
+                index=p,
+                underline="=" * len(title),
+                project=project,
+                previous=page_name(p - 1) if p else "index",
+                paragraphs="\n".join(PARAGRAPH.format(index=i) for i in range(5)),
+            ),
+        )
+
+    title = "Welcome to {}'s documentation!".format(project)
+    write(
+        source / "index.rst",
+        INDEX.format(
+            project=project,
+            underline="=" * len(title),
+            pages="".join("   {}\n".format(page_name(p)) for p in range(pages)),
+        ),
+    )
+
+
+def generate(root, projects=3, modules=10, pages=10, functions=10):
+    """Write a synthetic Home Documentation, replacing `root`
+
+    Args:
+        root (pathlib.Path): where to write it
+        projects (int, optional): Defaults to 3. Number of projects
+        modules (int, optional): Defaults to 10. Modules per project
+        pages (int, optional): Defaults to 10. Hand-written pages per project
+        functions (int, optional): Defaults to 10. Functions per module
+
+    Returns:
+        list(str): the projects' names
+    """
+    root = Path(root)
+    if root.exists():
+        rmtree(str(root))
+    (root / "docs" / "help").mkdir(parents=True)
+
+    with open(INCLUDE / "mkdocs.yml", "r") as f:
+        lines = f.readlines()
+    lines[0] = "site_name: Synthetic - Home Documentation\n"
+    with open(root / "mkdocs.yml", "w") as f:
+        f.writelines(lines)
+    for name in ["How_To_Use_Mkinx.md", "Writing_Sphinx_Documentation.md"]:
+        copyfile(str(INCLUDE / name), str(root / "docs" / "help" / name))
+
+    names = [project_name(i) for i in range(projects)]
+    for name in names:
+        generate_project(root, name, modules, pages, functions)
+
+    write(
+        root / "docs" / "index.md",
+        "Synthetic Home Documentation\n\n# Projects\n\n"
+        + "".join("* [{0}](/{0}) - Project {0}\n".format(n) for n in names),
+    )
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="where to write the Home Documentation")
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--functions", type=int, default=10)
+    args = parser.parse_args(argv)
+    names = generate(args.root, args.projects, args.modules, args.pages, args.functions)
+    print("Generated {} projects in {}".format(len(names), args.root))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
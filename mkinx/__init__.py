@@ -14,12 +14,31 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from .commands import init
-from .commands import build
-from .commands import serve
-from .commands import version
-from .commands import autodoc
-from .commands import clean
-from .commands import __VERSION__
-from .utils import colors
+from .conf import __VERSION__
+
 __version__ = __VERSION__
+
+# The commands (and their dependencies: watchdog, the server...)
+# are only imported when first used, see __getattr__
+COMMANDS = [
+    "init",
+    "build",
+    "serve",
+    "version",
+    "autodoc",
+    "clean",
+    "export",
+    "worker",
+]
+
+
+def __getattr__(name):
+    if name in COMMANDS:
+        from . import commands
+
+        return getattr(commands, name)
+    if name == "colors":
+        from .utils import colors
+
+        return colors
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,197 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from .conf import APIDOC_RECORD
+
+# A module to document: its dotted name, whether it is a package and, if
+# so, its documented subpackages and submodules' names
+Module = namedtuple("Module", ["name", "is_package", "subpackages", "submodules"])
+
+OPTIONS = ["members", "undoc-members", "show-inheritance"]
+
+
+def walk_package(package_path, name=None):
+    """Collect the modules of a package and of its subpackages, recursively,
+    skipping private ones (_name) and directories without an __init__.py,
+    as `sphinx-apidoc` does
+
+    Args:
+        package_path (str): the package's directory
+        name (str, optional): Defaults to the directory's name. The
+            package's dotted name
+
+    Returns:
+        list(Module): the package and the modules it contains, packages
+            before their modules
+    """
+    name = name or os.path.basename(os.path.normpath(package_path))
+    subpackages, submodules, children = [], [], []
+    with os.scandir(package_path) as entries:
+        entries = sorted(entries, key=lambda e: e.name)
+    for entry in entries:
+        stem, extension = os.path.splitext(entry.name)
+        if entry.name.startswith(("_", ".")):
+            continue
+        if entry.is_dir():
+            if os.path.isfile(os.path.join(entry.path, "__init__.py")):
+                modules = walk_package(entry.path, name + "." + entry.name)
+                subpackages.append(modules[0].name)
+                children += modules
+        elif extension == ".py" and stem.isidentifier():
+            submodules.append(name + "." + stem)
+            children.append(Module(name + "." + stem, False, [], []))
+    return [Module(name, True, subpackages, submodules)] + children
+
+
+def _toctree(title, names):
+    if not names:
+        return ""
+    return "{}\n{}\n\n.. toctree::\n\n{}\n\n".format(
+        title, "-" * len(title), "\n".join("    " + n for n in names)
+    )
+
+
+def render_stub(module):
+    """A module's .rst page, titled with its name without its package's
+    (``models`` for package.classif.models)
+
+    Returns:
+        str: the page's content
+    """
+    title = "``{}``".format(module.name.split(".")[-1])
+    content = "{}\n{}\n\n.. automodule:: {}\n{}\n\n".format(
+        title,
+        "=" * len(title),
+        module.name,
+        "\n".join("    :{}:".format(o) for o in OPTIONS),
+    )
+    content += _toctree("Subpackages", module.subpackages)
+    content += _toctree("Submodules", module.submodules)
+    return content.rstrip("\n") + "\n"
+
+
+def _digest(content):
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def sync_stubs(package_path, source_path, record):
+    """Write the .rst pages of a package's modules in source_path, in one
+    pass over the package and without importing it.
+
+    Only the missing pages and the pages whose content changed (a
+    submodule was added, removed or renamed) are written, and the pages of
+    modules which no longer exist are removed. Pages edited since mkinx
+    wrote them are left as they are. Pages are only read if their stats
+    changed since they were written.
+
+    Args:
+        package_path (pathlib.Path): the package's directory
+        source_path (pathlib.Path): the Sphinx source directory
+        record (dict): {"stubs": {page: [digest of the content written,
+            mtime, size]}}, updated
+
+    Returns:
+        tuple(list(str)): the pages written and removed
+    """
+    stubs = record.setdefault("stubs", {})
+    modules = walk_package(str(package_path))
+    expected = {m.name + ".rst": render_stub(m) for m in modules}
+
+    def current_digest(path, page):
+        """The digest of a page's content, None if it does not exist"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        known = stubs.get(page)
+        if known and known[1:] == [stat.st_mtime_ns, stat.st_size]:
+            return known[0]
+        with open(path, "r") as f:
+            return _digest(f.read())
+
+    def write(path, page, content):
+        with open(path, "w") as f:
+            f.write(content)
+        stat = os.stat(path)
+        stubs[page] = [_digest(content), stat.st_mtime_ns, stat.st_size]
+
+    # Plain strings: pathlib's overhead shows with thousands of modules
+    source_path = str(source_path)
+    written, removed = [], []
+    for page, content in expected.items():
+        path = os.path.join(source_path, page)
+        digest = _digest(content)
+        current = current_digest(path, page)
+        if current == digest:
+            if stubs.get(page, [None])[0] != digest:
+                stat = os.stat(path)
+                stubs[page] = [digest, stat.st_mtime_ns, stat.st_size]
+            continue
+        if current is not None and stubs.get(page, [None])[0] != current:
+            # Edited by hand
+            continue
+        write(path, page, content)
+        written.append(page)
+
+    for page in sorted(set(stubs) - set(expected)):
+        path = os.path.join(source_path, page)
+        current = current_digest(path, page)
+        if current is None or current == stubs[page][0]:
+            if current is not None:
+                os.remove(path)
+                removed.append(page)
+            del stubs[page]
+    return written, removed
+
+
+def load_record(dir_path):
+    """APIDOC_RECORD: {project: see `sync_stubs`}"""
+    try:
+        with open(dir_path / APIDOC_RECORD, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_record(dir_path, record):
+    path = dir_path / APIDOC_RECORD
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(record, f)
+
+
+def refresh_stubs(project_path, dir_path):
+    """Sync the API pages of a project documented by `mkinx autodoc` with
+    its package, as builds do before checking whether it changed
+
+    Returns:
+        bool: whether pages were written or removed
+    """
+    record = load_record(dir_path)
+    if project_path.name not in record or not (project_path / "source").is_dir():
+        return False
+    written, removed = sync_stubs(
+        project_path / project_path.name,
+        project_path / "source",
+        record[project_path.name],
+    )
+    save_record(dir_path, record)
+    return bool(written or removed)
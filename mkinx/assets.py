@@ -0,0 +1,152 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .conf import COMPRESS_MIN_SIZE, PRECOMPRESS_RECORD
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions of the built files worth compressing
+COMPRESSIBLE = {".html", ".js", ".json", ".css", ".svg", ".txt", ".xml", ".map"}
+
+# Content-Encoding and suffix of the precompressed variants, by preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+# Serializes the updates of PRECOMPRESS_RECORD by concurrent precompress calls
+_record_lock = threading.Lock()
+
+
+def encoders():
+    """Compression functions, by the suffix of the variants they write"""
+    encoders = {".gz": lambda data: gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        encoders[".br"] = lambda data: brotli.compress(data)
+    return encoders
+
+
+def precompress(root, min_size=COMPRESS_MIN_SIZE, workers=None, home=None):
+    """Write .gz (and .br if the brotli package is installed) siblings of
+    the compressible files of a built site, so that the server does not
+    compress them on each request. Variants are given their file's mtime:
+    files which did not change since their last compression are skipped.
+
+    The compressed files are recorded in the Home Documentation's
+    PRECOMPRESS_RECORD: once such a file is deleted, its variants are
+    removed. Other .gz and .br files (archives, downloads) are never touched.
+
+    Args:
+        root (pathlib.Path): the built site (site/ or a project's build/html)
+        min_size (int, optional): Defaults to COMPRESS_MIN_SIZE. Smaller
+            files are not compressed
+        workers (int, optional): Defaults to None. Number of files
+            compressed concurrently, see ThreadPoolExecutor
+        home (pathlib.Path, optional): Defaults to None. The Home
+            Documentation root holds the record. Without it, variants of
+            deleted files are left in place
+
+    Returns:
+        int: number of variants written
+    """
+    compressors = encoders()
+    root = str(root)
+    files = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            suffix = os.path.splitext(filename)[1]
+            if suffix in COMPRESSIBLE and os.path.getsize(path) >= min_size:
+                files.append(path)
+
+    if home is not None:
+        compressed = [os.path.relpath(p, root) for p in files]
+        for base in _record_compressed(home, root, compressed) - set(compressed):
+            base = os.path.join(root, base)
+            if os.path.exists(base):
+                continue
+            for _, suffix in ENCODINGS:
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+
+    # zlib and brotli release the GIL while compressing
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(lambda p: _compress_file(p, compressors), files))
+
+
+def _record_compressed(home, root, compressed):
+    """Replace the files recorded for root in the Home Documentation's
+    PRECOMPRESS_RECORD
+
+    Args:
+        home (pathlib.Path): the Home Documentation root
+        root (str): the built site
+        compressed (list): paths of its compressed files, relative to root
+
+    Returns:
+        set: the paths previously recorded for root
+    """
+    record_path = home / PRECOMPRESS_RECORD
+    key = os.path.relpath(root, str(home))
+    with _record_lock:
+        try:
+            with open(str(record_path), "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            record = {}
+        previous = set(record.get(key, []))
+        record[key] = sorted(compressed)
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(str(record_path), "w") as f:
+            json.dump(record, f)
+    return previous
+
+
+def _compress_file(path, encoders):
+    stat = os.stat(path)
+    data = None
+    written = 0
+    for suffix, compress in encoders.items():
+        variant = path + suffix
+        try:
+            if os.stat(variant).st_mtime_ns == stat.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        compressed = compress(data)
+        try:
+            with open(variant, "rb") as f:
+                unchanged = f.read() == compressed
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            with open(variant, "wb") as f:
+                f.write(compressed)
+            written += 1
+        os.utime(variant, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return written
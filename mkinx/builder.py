@@ -0,0 +1,646 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from shutil import copytree, rmtree
+
+from . import apidoc, assets, mocks, profiling, shared, utils
+from .conf import HTML_LOCATION, MANIFEST
+
+# Outcome of a project's Sphinx build, with the phases profiled while
+# building it (see profiling.Tracer)
+BuildResult = namedtuple("BuildResult", ["project", "returncode", "output", "phases"])
+BuildResult.__new__.__defaults__ = ((),)
+
+
+# Top-level directories of a project (or of the Home Documentation) holding
+# its outputs, which are never inputs of a build
+IGNORED_DIRS = {"build", "site"}
+
+
+class BuildManifest:
+    """Content hashes of the inputs of each target (a project or "home")
+    as of its last successful build, persisted in MANIFEST.
+
+    Files are only re-hashed when their size or mtime changed so that
+    checking an unchanged tree costs a directory walk.
+    """
+
+    def __init__(self, dir_path):
+        self.root = dir_path
+        self.path = dir_path / MANIFEST
+        self.pending = {}
+        try:
+            with open(self.path, "r") as f:
+                self.targets = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.targets = {}
+
+    def hash_inputs(self, target, inputs, extra=""):
+        """Hash a target's input files and directories
+
+        Args:
+            target (str): name of the target in the manifest
+            inputs (list(pathlib.Path)): files and directories to hash
+            extra (str, optional): Defaults to "". Anything else the build
+                depends on, such as flags
+
+        Returns:
+            dict: the target's digest and its files' stats and hashes
+        """
+        known = self.targets.get(target, {}).get("files", {})
+        files = {}
+        for path in inputs:
+            for file_path in _walk_files(path):
+                stat = file_path.stat()
+                key = os.path.relpath(str(file_path), str(self.root))
+                previous = known.get(key)
+                if previous and previous[:2] == [stat.st_mtime_ns, stat.st_size]:
+                    files[key] = previous
+                else:
+                    files[key] = [stat.st_mtime_ns, stat.st_size, _hash_file(file_path)]
+
+        digest = hashlib.sha1(extra.encode())
+        for key in sorted(files):
+            digest.update("{}\0{}\0".format(key, files[key][2]).encode())
+        return {"digest": digest.hexdigest(), "files": files}
+
+    def is_stale(self, target, inputs, output, extra=""):
+        """Whether a target must be rebuilt: its output is missing or its
+        inputs changed since its last successful build.
+
+        Args:
+            target (str): name of the target in the manifest
+            inputs (list(pathlib.Path)): files and directories to hash
+            output (pathlib.Path): a file the build is expected to produce
+            extra (str, optional): Defaults to "". See `hash_inputs`
+
+        Returns:
+            bool: True if the target must be rebuilt
+        """
+        self.pending[target] = self.hash_inputs(target, inputs, extra)
+        previous = self.targets.get(target, {}).get("digest")
+        return not output.exists() or previous != self.pending[target]["digest"]
+
+    def record(self, target):
+        """Mark a target as successfully built with the inputs hashed
+        by the last call to `is_stale`
+        """
+        if target in self.pending:
+            self.targets[target] = self.pending.pop(target)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.targets, f)
+
+
+class BuildCache:
+    """Outputs of successful builds, keyed by their target and the digest
+    of their inputs (see `BuildManifest`). `mkinx build --versions` shares
+    one between the builds of all versions: a target whose inputs are the
+    same in several versions is only built once.
+
+    Outputs are copied rather than hardlinked: Sphinx writes its pages in
+    place.
+
+    Args:
+        root (pathlib.Path): the cache's directory
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    @classmethod
+    def from_environment(cls):
+        """The cache set by `mkinx build --versions`, if any"""
+        root = os.getenv("MKINX_BUILD_CACHE")
+        return cls(root) if root else None
+
+    def path(self, target, digest):
+        return self.root / "{}-{}".format(target, digest)
+
+    def restore(self, target, digest, destination):
+        """Copy a target's cached output to `destination`, if there is one
+
+        Returns:
+            bool: whether the output was restored
+        """
+        cached = self.path(target, digest)
+        if not cached.is_dir():
+            return False
+        rmtree(str(destination), ignore_errors=True)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        copytree(str(cached), str(destination))
+        return True
+
+    def store(self, target, digest, source):
+        """Cache a target's output, unless it was already"""
+        cached = self.path(target, digest)
+        if cached.exists() or not source.is_dir():
+            return
+        temporary = Path("{}.{}.tmp".format(cached, os.getpid()))
+        rmtree(str(temporary), ignore_errors=True)
+        copytree(str(source), str(temporary))
+        try:
+            os.rename(str(temporary), str(cached))
+        except OSError:
+            # Another version's build cached it meanwhile
+            rmtree(str(temporary), ignore_errors=True)
+
+
+def _walk_files(path):
+    if path.is_file():
+        yield path
+        return
+    for root, dirs, filenames in os.walk(str(path)):
+        dirs[:] = sorted(d for d in dirs if not is_cache_dir(d))
+        for filename in sorted(filenames):
+            if not filename.endswith(".pyc"):
+                yield path / os.path.relpath(os.path.join(root, filename), str(path))
+
+
+def is_cache_dir(name):
+    """Whether a directory, at any depth, holds bytecode or tools' state"""
+    return name == "__pycache__" or name.startswith(".")
+
+
+def project_inputs(project_path):
+    """The files and directories of a project its build depends on: all but
+    its outputs (IGNORED_DIRS), which are only excluded at its top level so
+    that subpackages named build or site are still inputs
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+
+    Returns:
+        list(pathlib.Path): the project's inputs
+    """
+    return sorted(
+        path
+        for path in project_path.iterdir()
+        if path.name not in IGNORED_DIRS
+        and not (path.is_dir() and is_cache_dir(path.name))
+    )
+
+
+def project_files(project_path):
+    """Iterate over the files of a project's inputs, see `project_inputs`"""
+    for path in project_inputs(project_path):
+        yield from _walk_files(path)
+
+
+def _hash_file(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def project_is_stale(manifest, project, dir_path, offline=False):
+    """Whether a project's directory (its source/ tree with conf.py, its
+    Python package, its Makefile...) changed since it was last built
+    """
+    return manifest.is_stale(
+        project,
+        project_inputs(dir_path / project),
+        dir_path / project / HTML_LOCATION / "index.html",
+        extra="offline" if offline else "",
+    )
+
+
+def home_is_stale(manifest, dir_path, offline=False):
+    """Whether mkdocs's home documentation changed since it was last built"""
+    return manifest.is_stale(
+        "home",
+        [dir_path / "docs", dir_path / "mkdocs.yml"],
+        dir_path / "site" / "index.html",
+        extra="offline" if offline else "",
+    )
+
+
+def uses_stock_makefile(project_path):
+    """Whether a project's Makefile is the one written by `sphinx-quickstart`
+    (or there is none), in which case `make html` can be replaced by an
+    in-process Sphinx application.
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+
+    Returns:
+        bool: True if the project can be built in-process
+    """
+    if not (project_path / "source" / "conf.py").exists():
+        return False
+    makefile = project_path / "Makefile"
+    if not makefile.exists():
+        return True
+
+    with open(makefile, "r") as f:
+        content = f.read()
+    variables = dict(re.findall(r"^(\w+)\s*\??=[ \t]*(.*?)\s*$", content, re.M))
+    return (
+        variables.get("SPHINXBUILD") == "sphinx-build"
+        and variables.get("SOURCEDIR") == "source"
+        and variables.get("BUILDDIR") == "build"
+        and not variables.get("SPHINXOPTS")
+        and '-M $@ "$(SOURCEDIR)" "$(BUILDDIR)"' in content
+    )
+
+
+class SphinxProject:
+    """A Sphinx application building a project's html documentation in the
+    current process, as `make html` would. It can be kept warm and built
+    again: only the documents which changed are then read and written.
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+        freshenv (bool, optional): Defaults to False. Ignore the
+            environment pickled by a previous build
+    """
+
+    def __init__(self, project_path, freshenv=False):
+        from sphinx.application import Sphinx
+
+        self.project_path = project_path
+        self.conf_mtime = self.get_conf_mtime()
+        self.output = io.StringIO()
+        self.env_updated = None
+
+        # conf.py usually inserts the project's package in sys.path: keep
+        # those entries for this project's builds only
+        saved_path = list(sys.path)
+        try:
+            self.app = Sphinx(
+                str(project_path / "source"),
+                str(project_path / "source"),
+                str(project_path / "build" / "html"),
+                str(project_path / "build" / "doctrees"),
+                "html",
+                status=self.output,
+                warning=self.output,
+                freshenv=freshenv,
+            )
+            self.sys_path = [p for p in sys.path if p not in saved_path]
+        finally:
+            sys.path[:] = saved_path
+        # Sphinx emits env-updated once all documents are read, before
+        # writing them: split the build's profile there
+        self.app.connect("env-updated", self.on_env_updated)
+
+    def on_env_updated(self, app, env):
+        self.env_updated = profiling.snapshot()
+
+    def get_conf_mtime(self):
+        return (self.project_path / "source" / "conf.py").stat().st_mtime_ns
+
+    def build(self):
+        """Build the project's documentation
+
+        Returns:
+            BuildResult: the project, Sphinx's status code and its output
+        """
+        from sphinx.util import logging
+
+        self.output.seek(0)
+        self.output.truncate()
+        # Sphinx's loggers are global: point them back to this project
+        logging.setup(self.app, self.output, self.output)
+        _forget_modules(self.project_path)
+
+        saved_path = list(sys.path)
+        sys.path[:0] = self.sys_path
+        project = self.project_path.name
+        self.env_updated = None
+        begin = profiling.snapshot()
+        try:
+            self.app.build()
+            returncode = self.app.statuscode
+        except Exception:
+            traceback.print_exc(file=self.output)
+            returncode = 1
+        finally:
+            sys.path[:] = saved_path
+            end = profiling.snapshot()
+            if self.env_updated is None:
+                profiling.tracer.record("sphinx read", project, begin, end)
+            else:
+                profiling.tracer.record("sphinx read", project, begin, self.env_updated)
+                profiling.tracer.record("sphinx write", project, self.env_updated, end)
+        return BuildResult(self.project_path.name, returncode, self.output.getvalue())
+
+
+def _forget_modules(project_path):
+    """Remove a project's modules from sys.modules so that autodoc
+    imports their current version
+    """
+    prefix = str(project_path) + os.sep
+    for name, module in list(sys.modules.items()):
+        if (getattr(module, "__file__", None) or "").startswith(prefix):
+            del sys.modules[name]
+
+
+class SphinxApps:
+    """Warm Sphinx applications, one per project, for long-lived processes
+    such as `mkinx serve`. A project's application is re-created when its
+    conf.py changes.
+    """
+
+    def __init__(self):
+        self.apps = {}
+        # Sphinx's logging and sys.path are global to the process
+        self.lock = threading.Lock()
+
+    def build(self, project_path):
+        with self.lock:
+            app = self.apps.get(project_path)
+            if app is None or app.conf_mtime != app.get_conf_mtime():
+                app = self.apps[project_path] = SphinxProject(project_path)
+            return app.build()
+
+
+def build_project(project, dir_path, clean=True, apps=None):
+    """Build a project's html documentation, capturing its output so
+    that concurrent builds do not interleave.
+
+    Projects using `sphinx-quickstart`'s Makefile are built by a Sphinx
+    application running in this process, others with `make html`.
+
+    Args:
+        project (str): project to build
+        dir_path (pathlib.Path): the Home Documentation's path
+        clean (bool, optional): Defaults to True. Start from an empty build
+            directory, throwing away Sphinx's environment
+        apps (SphinxApps, optional): Defaults to None. Warm applications
+            to build the project with
+
+    Returns:
+        BuildResult: the project, the build's return code, its output and
+            the phases profiled while building it
+    """
+    tracer = profiling.tracer
+    mark = len(tracer.phases)
+    result = _build_project(project, dir_path, clean, apps)
+    return result._replace(phases=tracer.phases[mark:])
+
+
+def _build_project(project, dir_path, clean, apps):
+    project_path = dir_path / project
+    tracer = profiling.tracer
+    if uses_stock_makefile(project_path):
+        try:
+            if clean:
+                with tracer.phase("make clean", project):
+                    rmtree(str(project_path / "build"), ignore_errors=True)
+            if apps is not None and not clean:
+                return apps.build(project_path)
+            with tracer.phase("sphinx setup", project):
+                app = SphinxProject(project_path, freshenv=clean)
+            return app.build()
+        except ImportError:
+            # No Sphinx in this interpreter: let make find one
+            pass
+        except Exception:
+            return BuildResult(project, 1, traceback.format_exc())
+
+    output = ""
+    for command in (["clean", "html"] if clean else ["html"]):
+        try:
+            with tracer.phase("make " + command, project):
+                process = subprocess.run(
+                    ["make", command],
+                    cwd=str(project_path),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    universal_newlines=True,
+                )
+        except OSError as e:
+            # No make, or no project directory
+            return BuildResult(project, 1, output + "make {}: {}".format(command, e))
+        output += process.stdout
+        if process.returncode:
+            break
+    return BuildResult(project, process.returncode, output)
+
+
+def finish_project(result, dir_path, verbose=False, offline=False):
+    """Report a project's build and, if it succeeded, add the link to
+    the Documentation's Home, move its static files to the shared store
+    (see shared.SharedStore) and precompress its files
+
+    Args:
+        result (BuildResult): the project's build
+        dir_path (pathlib.Path): the Home Documentation's path
+        verbose (bool, optional): Defaults to False. Print Sphinx's output
+            even if the build succeeded
+        offline (bool, optional): Defaults to False. Convert the project's
+            html files for offline use (see utils.make_offline) too
+    """
+    if verbose or result.returncode:
+        print(result.output)
+
+    if result.returncode:
+        print(
+            "{}Building {} failed{}".format(
+                utils.colors.FAIL, result.project, utils.colors.ENDC
+            )
+        )
+        return
+
+    tracer = profiling.tracer
+    with tracer.phase("overwrite_view_source", result.project):
+        utils.overwrite_view_source(result.project, dir_path)
+    if offline:
+        with tracer.phase("make_offline", result.project):
+            utils.make_offline(dir_path, [result.project], site=False)
+    with tracer.phase("share static", result.project):
+        store = shared.SharedStore(dir_path)
+        store.share_static(result.project, dir_path / result.project / HTML_LOCATION)
+        store.collect_garbage(utils.get_projects(dir_path))
+        store.save()
+    with tracer.phase("precompress", result.project):
+        assets.precompress(dir_path / result.project / HTML_LOCATION, home=dir_path)
+        assets.precompress(store.root, home=dir_path)
+
+    if verbose:
+        print("\n>>>>>> Done {}\n\n\n".format(result.project))
+
+
+def build_projects(
+    projects,
+    dir_path,
+    jobs=1,
+    verbose=False,
+    manifest=None,
+    clean=True,
+    offline=False,
+    cache=None,
+    workers=None,
+):
+    """Build the projects' Sphinx documentations, `jobs` of them at a time.
+    Each project is finished (see `finish_project`) as soon as its own
+    build is over.
+
+    The API pages and mocked imports of the projects documented by
+    `mkinx autodoc` are synced with their package first (see
+    apidoc.refresh_stubs and mocks.refresh_mocks).
+
+    Args:
+        projects (iterable(str)): projects to build
+        dir_path (pathlib.Path): the Home Documentation's path
+        jobs (int, optional): Defaults to 1. Number of concurrent builds
+        verbose (bool, optional): Defaults to False. Print Sphinx's output
+        manifest (BuildManifest, optional): Defaults to None. If provided,
+            successful builds are recorded in it and, unless `clean` is
+            True, projects whose inputs did not change are skipped
+        clean (bool, optional): Defaults to True. See `build_project`
+        offline (bool, optional): Defaults to False. See `finish_project`
+        cache (BuildCache, optional): Defaults to None. If provided with a
+            manifest, projects are restored from it rather than built when
+            their inputs' digest is cached, and stored in it once built
+        workers (list(str), optional): Defaults to None. "host:port"
+            addresses of `mkinx worker` processes to build the projects on
+            instead (see workers.WorkerPool), one project per worker at a
+            time
+
+    Returns:
+        list(BuildResult): the builds which failed
+    """
+    projects = sorted(projects)
+    tracer = profiling.tracer
+    with tracer.phase("sync autodoc"):
+        for project in projects:
+            apidoc.refresh_stubs(dir_path / project, dir_path)
+            mocks.refresh_mocks(dir_path / project, dir_path)
+    if manifest is not None:
+        with tracer.phase("staleness check"):
+            stale = [
+                p for p in projects if project_is_stale(manifest, p, dir_path, offline)
+            ]
+        projects = projects if clean else stale
+        if verbose:
+            print("Up to date projects are skipped, building:", projects)
+    failed = []
+
+    def finish(result):
+        tracer.merge(result.phases)
+        try:
+            finish_project(result, dir_path, verbose, offline)
+        except Exception:
+            # Reported as a failed build, which finish_project only prints
+            result = result._replace(
+                returncode=1, output=result.output + traceback.format_exc()
+            )
+            finish_project(result, dir_path, verbose, offline)
+        if result.returncode:
+            failed.append(result)
+        elif manifest is not None:
+            digest = manifest.pending[result.project]["digest"]
+            manifest.record(result.project)
+            if cache is not None:
+                cache.store(
+                    result.project, digest, dir_path / result.project / HTML_LOCATION
+                )
+
+    if cache is not None and manifest is not None:
+        built = []
+        for project in projects:
+            digest = manifest.pending[project]["digest"]
+            with tracer.phase("restore from cache", project):
+                restored = cache.restore(
+                    project, digest, dir_path / project / HTML_LOCATION
+                )
+            if restored:
+                # Sphinx's environment does not match the restored pages
+                rmtree(
+                    str(dir_path / project / "build" / "doctrees"), ignore_errors=True
+                )
+                finish(BuildResult(project, 0, "Restored from the build cache"))
+            else:
+                built.append(project)
+        projects = built
+
+    if workers:
+        from .workers import WorkerPool
+
+        pool = WorkerPool(workers)
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            futures = [
+                executor.submit(
+                    pool.build,
+                    p,
+                    dir_path,
+                    manifest.pending[p]["digest"] if manifest is not None else None,
+                    clean,
+                )
+                for p in projects
+            ]
+            for future in as_completed(futures):
+                finish(future.result())
+        return failed
+
+    if jobs <= 1 or len(projects) <= 1:
+        for project in projects:
+            finish(build_project(project, dir_path, clean))
+        return failed
+
+    # Workers record their own phases, returned with their results
+    initializer = profiling.enable if profiling.is_enabled() else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as executor:
+        futures = [executor.submit(build_project, p, dir_path, clean) for p in projects]
+        for future in as_completed(futures):
+            finish(future.result())
+    return failed
+
+
+def rebuild_project(project, dir_path, apps=None, offline=False):
+    """Rebuild a single project if its inputs changed, as the watcher does
+    when one of its files changes, and record it in the build manifest
+
+    Args:
+        project (str): project to rebuild
+        dir_path (pathlib.Path): the Home Documentation's path
+        apps (SphinxApps, optional): Defaults to None. Warm applications
+            to build the project with
+        offline (bool, optional): Defaults to False. See `finish_project`
+
+    Returns:
+        bool: False if the project's build failed
+    """
+    apidoc.refresh_stubs(dir_path / project, dir_path)
+    mocks.refresh_mocks(dir_path / project, dir_path)
+    manifest = BuildManifest(dir_path)
+    if not project_is_stale(manifest, project, dir_path, offline):
+        return True
+    result = build_project(project, dir_path, clean=False, apps=apps)
+    finish_project(result, dir_path, offline=offline)
+    if result.returncode:
+        return False
+    manifest.record(project)
+    manifest.save()
+    return True
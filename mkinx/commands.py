@@ -16,21 +16,18 @@
 
 import getpass
 import os
-import socketserver
 import subprocess
 import sys
 import threading
 import time
 import warnings
-from http.server import SimpleHTTPRequestHandler
 from pathlib import Path
 from shutil import copyfile, copytree, move, rmtree
 
-import pexpect
-from watchdog.observers import Observer
-
+# Commands import the modules they need (watchdog, the server...)
+# themselves: `mkinx version` or `mkinx clean` should not pay for them
 from . import utils
-from .conf import __VERSION__, PORT
+from .conf import __VERSION__, HTML_LOCATION, PORT, SEARCH_DIR, WORKER_DIR, WORKER_PORT
 
 
 def custom_formatwarning(msg, *args, **kwargs):
@@ -45,50 +42,46 @@ warnings.formatwarning = custom_formatwarning
 def serve(args):
     """Start a server which will watch .md and .rst files for changes.
     If a md file changes, the Home Documentation is rebuilt. If a .rst
-    file changes, the updated sphinx project is rebuilt
+    (or .py) file changes, the updated sphinx project is rebuilt,
+    in-process, by a Sphinx application kept warm for the server's lifetime.
+    Build outputs (site/ and the projects' build/) are not watched.
+    The Home Documentation is rebuilt in-process too, only re-rendering
+    the pages which changed when possible (see `home.HomeSite`).
+
+    Unless `args.no_reload`, served pages reload once their project (or the
+    Home Documentation) is rebuilt, and the edit-to-reload latency is
+    printed when the server stops (see `livereload.LiveReload`).
 
     Args:
         args (ArgumentParser): flags from the CLI
     """
+    from watchdog.observers import Observer
+
+    from . import assets, builder, home, livereload, profiling, server, watcher
+
     # Sever's parameters
     port = args.serve_port or PORT
     host = "0.0.0.0"
 
     # Current working directory
     dir_path = Path().absolute()
-    web_dir = dir_path / "site"
 
-    # Update routes
-    utils.set_routes()
+    if args.profile:
+        profiling.enable()
+
+    site = home.HomeSite(dir_path)
 
     # Offline mode
     if args.offline:
         os.environ["MKINX_OFFLINE"] = "true"
-        _ = subprocess.check_output("mkdocs build > /dev/null", shell=True)
-        utils.make_offline()
-
-    class MkinxHTTPHandler(SimpleHTTPRequestHandler):
-        """Class routing urls (paths) to projects (resources)
-        """
-
-        def translate_path(self, path):
-            # default root -> cwd
-            location = str(web_dir)
-            route = location
-
-            if len(path) != 0 and path != "/":
-                for key, loc in utils.get_routes():
-                    if path.startswith(key):
-                        location = loc
-                        path = path[len(key) :]
-                        break
-
-            if location[-1] == "/" or not path or path[0] == "/":
-                route = location + path
-            else:
-                route = location + "/" + path
+        site.build()
+        projects = utils.get_projects(dir_path)
+        utils.make_offline(dir_path, projects)
+        assets.precompress(dir_path / "site", home=dir_path)
+        for project in projects:
+            assets.precompress(dir_path / project / HTML_LOCATION, home=dir_path)
 
-            return route.split("?")[0]
+    live = None if args.no_reload else livereload.LiveReload()
 
     # Serve as deamon thread
     success = False
@@ -97,7 +90,14 @@ def serve(args):
     try:
         while not success:
             try:
-                httpd = socketserver.TCPServer((host, port), MkinxHTTPHandler)
+                httpd = server.MkinxHTTPServer(
+                    (host, port),
+                    server.MkinxHTTPHandler,
+                    dir_path,
+                    workers=args.serve_workers,
+                    cache_size=args.cache_size << 20,
+                    live=live,
+                )
                 success = True
             except OSError:
                 count += 1
@@ -115,18 +115,38 @@ def serve(args):
         print("Aborting.")
         return
 
-    httpd.allow_reuse_address = True
     print("\nServing at http://{}:{}\n".format(host, port))
     thread = threading.Thread(target=httpd.serve_forever)
     thread.daemon = True
     thread.start()
+    if live is not None:
+        live.start()
 
     # Watch for changes
-    event_handler = utils.MkinxFileHandler(
-        patterns=["*.rst", "*.md", "*.yml", "*.yaml"]
+    scheduler = watcher.RebuildScheduler(
+        dir_path, apps=builder.SphinxApps(), debounce=args.debounce, site=site
+    )
+    scheduler.start()
+    event_handler = watcher.MkinxFileHandler(
+        scheduler, patterns=["*.rst", "*.py", "*.md", "*.yml", "*.yaml"]
     )
     observer = Observer()
-    observer.schedule(event_handler, path=str(dir_path), recursive=True)
+    watches = watcher.InputWatches(observer, event_handler, dir_path)
+    watches.sync()
+
+    def on_rebuilt(target, edited):
+        if target is watcher.HOME:
+            # The home's index may list new projects
+            watches.sync()
+            httpd.routes.refresh()
+            location = httpd.routes.default
+        else:
+            location = str(httpd.routes.registry.html_location(target))
+        httpd.cache.invalidate(location)
+        if live is not None:
+            live.publish(location, edited)
+
+    scheduler.listeners.append(on_rebuilt)
     observer.start()
 
     try:
@@ -135,7 +155,18 @@ def serve(args):
     except KeyboardInterrupt:
         observer.stop()
         httpd.server_close()
+        if live is not None:
+            live.stop()
     observer.join()
+    scheduler.stop()
+    print(
+        "{} file events, {} of which did not need a rebuild".format(
+            event_handler.received, event_handler.filtered
+        )
+    )
+    if live is not None:
+        print(live.summary())
+    profiling.report(dir_path)
 
 
 def build(args):
@@ -148,23 +179,65 @@ def build(args):
         3. Update the documentations' index.html file to add a link
            back to the home of all documentations
         4. Build mkdoc's home documentation
+        5. Write precompressed (gzip, brotli) variants of the built files
+        6. Merge the projects' and the home's search indexes
+
+    Projects are built `args.jobs` at a time. mkdoc's home documentation
+    is built once all of them are done, and the command exits with an
+    error if any of them failed.
+
+    Projects (and the home documentation) whose inputs did not change since
+    their last successful build, as recorded in the build manifest, are
+    skipped and the others are rebuilt without `make clean`, unless
+    `args.clean` is set.
+
+    With `args.profile`, the wall time, CPU time and RSS growth of each phase
+    are summarized and written as a Chrome trace to `.mkinx/trace.json`.
+
+    With `args.versions`, the documentation is built as of each of these
+    git refs instead (see `versions.build_versions`).
+
+    With `args.build_workers`, projects are built by these `mkinx worker`
+    processes rather than locally (see `workers.WorkerPool`).
 
     Args:
         args (ArgumentParser): parsed args from an ArgumentParser
     """
+    from . import assets, builder, profiling, search
+
     # Proceed?
     go = False
 
     # Current working directory
     dir_path = Path().resolve()
 
+    if args.versions:
+        from . import versions
+
+        refs = [r.strip() for r in args.versions.split(",") if r.strip()]
+        failed = versions.build_versions(
+            dir_path,
+            refs,
+            jobs=args.jobs or 1,
+            clean=args.clean,
+            offline=args.offline,
+            verbose=args.verbose,
+        )
+        if failed:
+            print(
+                "{}Build failed for: {}{}".format(
+                    utils.colors.FAIL, ", ".join(failed), utils.colors.ENDC
+                )
+            )
+            sys.exit(1)
+        return
+
+    tracer = profiling.enable() if args.profile else profiling.tracer
+
     # Set of all available projects in the dir
-    # Projects must contain a PROJECT_MARKER file.
-    all_projects = {
-        m
-        for m in os.listdir(dir_path)
-        if os.path.isdir(m) and "source" in os.listdir(dir_path / m)
-    }
+    # Projects must contain a source/ folder.
+    with tracer.phase("discovery"):
+        all_projects = utils.get_projects(dir_path)
 
     if args.all and args.projects:
         print(
@@ -203,44 +276,140 @@ def build(args):
 
     if go:
         # Update projects links
-        listed_projects = utils.get_listed_projects()
+        with tracer.phase("discovery"):
+            listed_projects = utils.get_listed_projects(dir_path)
 
         # Don't update projects which are not listed in the Documentation's
         # Home if the -o flag was used
         if args.only_index:
             projects = listed_projects.intersection(projects)
         print("projects", projects)
-        for project_to_build in projects:
-            # Re-build documentation
-            warnings.warn("[sphinx]")
-            if args.verbose:
-                os.system(
-                    "cd {} && make clean && make html".format(
-                        dir_path / project_to_build
-                    )
-                )
-            else:
-                os.system(
-                    "cd {} && make clean && make html > /dev/null".format(
-                        dir_path / project_to_build
-                    )
+        manifest = builder.BuildManifest(dir_path)
+        cache = builder.BuildCache.from_environment()
+        warnings.warn("[sphinx]")
+        failed = builder.build_projects(
+            projects,
+            dir_path,
+            jobs=args.jobs or 1,
+            verbose=args.verbose,
+            manifest=manifest,
+            clean=args.clean,
+            offline=args.offline,
+            cache=cache,
+            workers=[w for w in (args.build_workers or "").split(",") if w.strip()],
+        )
+        manifest.save()
+
+        # Build Documentation, unless it did not change
+        with tracer.phase("staleness check"):
+            home_is_stale = builder.home_is_stale(manifest, dir_path, args.offline)
+        if home_is_stale or args.clean:
+            digest = manifest.pending["home"]["digest"]
+            with tracer.phase("mkdocs build"):
+                if cache is not None and cache.restore(
+                    "home", digest, dir_path / "site"
+                ):
+                    status = 0
+                elif args.verbose:
+                    status = os.system("mkdocs build")
+                    print("\n\n>>>>>> Build Complete.")
+                else:
+                    warnings.warn("[mkdocs]")
+                    status = os.system("mkdocs build > /dev/null")
+
+            if args.offline:
+                with tracer.phase("make_offline"):
+                    utils.make_offline(dir_path)
+            with tracer.phase("precompress"):
+                assets.precompress(dir_path / "site", home=dir_path)
+
+            if status == 0:
+                manifest.record("home")
+                manifest.save()
+                if cache is not None:
+                    cache.store("home", digest, dir_path / "site")
+
+        with tracer.phase("search index"):
+            search.build_search_index(dir_path, listed_projects)
+            assets.precompress(dir_path / SEARCH_DIR, home=dir_path)
+
+        profiling.report(dir_path)
+
+        if failed:
+            print(
+                "{}Build failed for: {}{}".format(
+                    utils.colors.FAIL,
+                    ", ".join(r.project for r in failed),
+                    utils.colors.ENDC,
                 )
+            )
+            sys.exit(1)
 
-            # Add link to Documentation's Home
-            utils.overwrite_view_source(project_to_build, dir_path)
 
-            if args.verbose:
-                print("\n>>>>>> Done {}\n\n\n".format(project_to_build))
-        # Build Documentation
-        if args.verbose:
-            os.system("mkdocs build")
-            print("\n\n>>>>>> Build Complete.")
-        else:
-            warnings.warn("[mkdocs]")
-            os.system("mkdocs build > /dev/null")
+def export(args):
+    """Export the built documentation (the Home Documentation, the listed
+    projects, the search index and the shared static files) to a directory
+    any static file server can serve, with the urls of `mkinx serve`.
+    Files are hardlinked to the build outputs and listed, with the routes
+    they come from, in the directory's manifest.
+
+    Args:
+        args (ArgumentParser): Flags from the CLI
+    """
+    from . import exporter
 
-        if args.offline:
-            utils.make_offline()
+    dir_path = Path().resolve()
+    output = Path(args.output).resolve()
+
+    listed = utils.get_listed_projects(dir_path)
+    missing = [
+        p
+        for p in sorted(listed)
+        if not (dir_path / p.strip("/") / HTML_LOCATION / "index.html").exists()
+    ]
+    if not (dir_path / "site" / "index.html").exists():
+        missing.insert(0, "site")
+    if missing:
+        print(
+            "{}Not built, run `mkinx build` first:{} {}".format(
+                utils.colors.WARNING, utils.colors.ENDC, ", ".join(missing)
+            )
+        )
+
+    try:
+        manifest = exporter.export(dir_path, output)
+    except ValueError as e:
+        print("{}Error{} {}".format(utils.colors.FAIL, utils.colors.ENDC, e))
+        return
+    print(
+        "{}Exported{} {} files to {}".format(
+            utils.colors.OKGREEN, utils.colors.ENDC, len(manifest["files"]), output
+        )
+    )
+
+
+def worker(args):
+    """Build projects for `mkinx build --build_workers` until interrupted.
+    The projects' sources are kept in .mkinx/worker/ so that unchanged
+    projects are not sent again.
+
+    Workers run the projects' code (conf.py, autodoc...): only listen on
+    trusted networks.
+
+    Args:
+        args (ArgumentParser): Flags from the CLI
+    """
+    from . import workers
+
+    address = (args.bind, args.serve_port or WORKER_PORT)
+    try:
+        workers.serve(address, Path().resolve() / WORKER_DIR)
+    except OSError as e:
+        print(
+            "{}Can't listen on {}:{}{} {}".format(
+                utils.colors.FAIL, *address, utils.colors.ENDC, e
+            )
+        )
 
 
 def init(args):
@@ -370,134 +539,153 @@ def version(args):
 
 
 def autodoc(args):
-    author = getpass.getuser()
-    project = Path().resolve().name
+    """Generate the Sphinx documentation of Python projects with autodoc,
+    add them to the Documentation's Home and build them.
 
-    if "y" not in input(
-        'Do you want to generate the documentation for "{}"? [y/n] :'.format(project)
-    ):
-        return
+    Without flags, the project is the current directory, which should be
+    in the Home Documentation's directory and contain a package of the same
+    name. From the Home Documentation, `args.all` selects every such
+    directory and `args.projects` some of them: they are set up
+    concurrently, `args.jobs` at a time, without asking anything and built
+    together. Projects which already have a documentation are skipped
+    unless `args.force` is set.
 
-    child = pexpect.spawnu("sphinx-quickstart", ["./"], encoding="utf-8")
-    res = child.expect(
-        ["> Separate source and build directories*", "> Please enter a new root path*"]
-    )
-    if res == 1:
+    Args:
+        args (ArgumentParser): Flags from the CLI
+    """
+    from . import scaffold
+
+    author = getpass.getuser()
+    windows = sys.platform in {"win32", "cygwin"}
+
+    if args.all and args.projects:
         print(
-            "\n{}Error{}".format(utils.colors.FAIL, utils.colors.ENDC),
-            "an existing conf.py has been found in the selected root path.",
+            "{}Can't use both the 'projects' and 'all' flags{}".format(
+                utils.colors.FAIL, utils.colors.ENDC
+            )
         )
+        return
+
+    if args.all or args.projects:
+        dir_path = Path().resolve()
+        if args.all:
+            project_paths = scaffold.find_projects(dir_path)
+        else:
+            project_paths = [Path(p).resolve() for p in args.projects]
+
+        invalid = [
+            p
+            for p in project_paths
+            if p.parent != dir_path or not (p / p.name / "__init__.py").exists()
+        ]
+        if invalid:
+            print(
+                "{}Error{} ".format(utils.colors.FAIL, utils.colors.ENDC),
+                "projects should be directories of the Home Documentation",
+                "containing a package of the same name:",
+                ", ".join(str(p) for p in invalid),
+            )
+            return
+
+        existing = [p for p in project_paths if scaffold.has_scaffold(p)]
+        if args.force:
+            for project_path in existing:
+                scaffold.clean(project_path)
+        elif existing:
+            print(
+                "Skipping projects which already have a documentation",
+                "(use -F to overwrite it):",
+                ", ".join(p.name for p in existing),
+            )
+            project_paths = [p for p in project_paths if p not in existing]
+        if not project_paths:
+            print("No project to document")
+            return
         print(
-            "sphinx-quickstart will not overwrite existing Sphinx projects by itself."
+            "\n    Setting up {} projects...".format(len(project_paths)),
+            "({} at a time)".format(args.jobs) if args.jobs > 1 else "",
         )
-        child.close()
-        if "y" in input(
-            "\n{}Force overwriting?{} (you will lose the current".format(
-                utils.colors.WARNING, utils.colors.ENDC
+    else:
+        project_path = Path().resolve()
+        dir_path = project_path.parent
+        if "y" not in input(
+            'Do you want to generate the documentation for "{}"? [y/n] :'.format(
+                project_path.name
             )
-            + " ./build/ and ./source/ folders) [y/n] : "
         ):
-            _ = subprocess.check_output("mkinx clean", shell=True)
-            child = pexpect.spawnu("sphinx-quickstart", ["./"], encoding="utf-8")
-            child.expect("> Separate source and build directories*")
-        else:
             return
-    print("\n    Setting up the project...")
 
-    windows = "y" if sys.platform in {"win32", "cygwin"} else "n"
+        if scaffold.has_scaffold(project_path):
+            print(
+                "\n{}Error{}".format(utils.colors.FAIL, utils.colors.ENDC),
+                "an existing conf.py has been found in ./source.",
+            )
+            if "y" in input(
+                "\n{}Force overwriting?{} (you will lose the current".format(
+                    utils.colors.WARNING, utils.colors.ENDC
+                )
+                + " ./build/ and ./source/ folders) [y/n] : "
+            ):
+                scaffold.clean(project_path)
+            else:
+                return
+        project_paths = [project_path]
+        print("\n    Setting up the project...")
 
-    child.sendline("y")
-    child.expect("> Name prefix*")
-    child.sendline()
-    child.expect("> Project name:*")
-    child.sendline(project)
-    child.expect("> Author name*")
-    child.sendline(author)
-    child.expect("> Project release*")
-    child.sendline()
-    child.expect("> Project language*")
-    child.sendline("")
-    child.expect("> Source file suffix*")
-    child.sendline("")
-    child.expect("> Name of your master document*")
-    child.sendline("")
-    child.expect("> Do you want to use the epub builder*")
-    child.sendline("")
-    child.expect("> autodoc: automatically insert docstrings*")
-    child.sendline("y")
-    child.expect("> doctest: automatically test code snippets*")
-    child.sendline("")
-    child.expect("> intersphinx: link between Sphinx documentation*")
-    child.sendline("")
-    child.expect('> todo: write "todo" entries*')
-    child.sendline("")
-    child.expect("> coverage: checks for documentation coverage")
-    child.sendline("")
-    child.expect("> imgmath: include math, rendered as PNG or SVG images*")
-    child.sendline("")
-    child.expect("> mathjax: include math*")
-    child.sendline("")
-    child.expect("> ifconfig: conditional inclusion of content*")
-    child.sendline("")
-    child.expect("> viewcode: include links to the source code*")
-    child.sendline("y")
-    child.expect("> githubpages: create .nojekyll file to publish the document*")
-    child.sendline("")
-    child.expect("> Create Makefile*")
-    child.sendline("")
-    child.expect("> Create Windows command*")
-    child.sendline(windows)
-    child.expect("Creating file*")
-    child.wait()
-    child.close()
+    results = scaffold.autodoc_projects(
+        project_paths, author, args.mock_imports, windows, args.jobs
+    )
+    projects = []
+    for result in results:
+        if result.error:
+            print(
+                "{}Error{} ".format(utils.colors.FAIL, utils.colors.ENDC),
+                "{} could not be documented,".format(result.project),
+                "it should contain an importable package of the same name",
+            )
+            if args.verbose:
+                print(result.error)
+        else:
+            projects.append(result.project)
+    if not projects:
+        return
+
+    index = dir_path / "docs" / "index.md"
+    if not index.exists():
+        print("Error: the project could not be added to your home documentation")
+        print("`mkinx autodoc` should be run from: ")
+        print("    path/to/documentation/new_python_project")
+    else:
+        for project in projects:
+            utils.add_project_to_doc_index(index, project)
 
     print("    Building documentation...")
     print(
-        '        If you see warnings such as "WARNING: autodoc: failed to import module',
-        '[...] No module named [...]"',
+        "        Third-party imports which are missing or slow to import are",
+        "mocked automatically (autodoc_mock_imports in source/conf.py).",
+        '\n        If you still see warnings such as "WARNING: autodoc: failed to',
+        'import module [...] No module named [...]"',
         "\n        consider mocking the imports with:",
         "\n             mkinx autodoc -m module1 module2 etc.",
         "\n        see http://www.sphinx-doc.org/en/stable/ext/autodoc.html#confval-autodoc_mock_imports",
     )
-
-    utils.set_sphinx_config(Path() / "source" / "conf.py", project, args.mock_imports)
-
-    try:
-        _ = subprocess.check_output(
-            "sphinx-apidoc -f -o source {} -e -M > /dev/null".format(project),
-            shell=True,
+    if scaffold.build(dir_path, projects, args.jobs):
+        print(
+            "{}Building the documentation failed{}".format(
+                utils.colors.FAIL, utils.colors.ENDC
+            )
         )
-    except subprocess.CalledProcessError as e:
-        # print(e)
+
+    if len(project_paths) > 1:
         print(
-            "{}Error{} ".format(utils.colors.FAIL, utils.colors.ENDC),
-            "you should run `autodoc` from a project folder,",
-            "with an importable project package",
+            "\n    {}Finished \u2713{} Documented {}\n".format(
+                utils.colors.OKGREEN, utils.colors.ENDC, ", ".join(projects)
+            )
         )
-        print("Cleaning...", end="")
-        _ = subprocess.check_output("mkinx clean", shell=True)
-        print(u"\u2713")
         return
 
-    utils.add_project_to_rst_index(Path() / "source" / "index.rst", project)
-    utils.remove_project_name_from_titles(Path() / "source")
-
-    os.remove(Path() / "source" / "modules.rst")
-
-    index = Path().resolve().parent / "docs" / "index.md"
-    if not index.exists():
-        print("Error: the project could not be added to your home documentation")
-        print("`mkinx autodoc` should be run from: ")
-        print("    path/to/documentation/new_python_project")
-    else:
-        utils.add_project_to_doc_index(index, project)
-
-    _ = subprocess.check_output(
-        "cd .. && mkinx build -F -p {} > /dev/null".format(project), shell=True
-    )
-
     print(
-        u"""\n    Added configuration file source/conf.py
+        """\n    Added configuration file source/conf.py
     Added documentation files /source/*.rst
     Added utility file ./Makefile
     {}
@@ -506,7 +694,7 @@ def autodoc(args):
 
     You can now enhance your master file source/index.rst
     and other documentation source files.\n""".format(
-            "Added utility file make.bat" if windows == "y" else "",
+            "Added utility file make.bat" if windows else "",
             utils.colors.OKGREEN,
             utils.colors.ENDC,
         )
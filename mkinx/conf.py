@@ -33,3 +33,50 @@ TO_REPLACE_WITH_HOME = '<a href="_sources'
 # New line replacing the above one
 NEW_HOME_LINK = '<h3><a href="/">Home</a></h3>'
 PORT = 8443
+# mkinx's own state, relative to the Home Documentation
+MKINX_DIR = ".mkinx"
+# Content hashes of the inputs of the last successful builds
+MANIFEST = MKINX_DIR + "/manifest.json"
+# Smaller built files are not precompressed
+COMPRESS_MIN_SIZE = 1024
+# Local stylesheet of the material icons, replacing Google Fonts' offline
+OFFLINE_ICONS_LINK = (
+    '<link rel="stylesheet"' + " href=/assets/stylesheets/material-style.css>"
+)
+# Stats of the html files already converted by make_offline
+OFFLINE_RECORD = MKINX_DIR + "/offline.json"
+# Cross-project search index, served at /_search
+SEARCH_DIR = MKINX_DIR + "/search"
+SEARCH_ROUTE = "/_search"
+# Projects' contributions to the search index, as of its last build
+SEARCH_CACHE_DIR = MKINX_DIR + "/search-cache"
+# Length of the terms' prefixes the search index is sharded by
+SEARCH_PREFIX_LENGTH = 2
+# Chrome trace written by `mkinx build --profile`
+TRACE = MKINX_DIR + "/trace.json"
+# Content-addressed store of the projects' static files, served at SHARED_ROUTE
+SHARED_DIR = MKINX_DIR + "/shared"
+SHARED_ROUTE = "/_shared"
+# Static files each project's pages reference through SHARED_ROUTE
+SHARED_RECORD = MKINX_DIR + "/shared.json"
+# Written at the root of `mkinx export`'s output
+EXPORT_MANIFEST = "mkinx-export.json"
+# Git worktrees of the versions built by `mkinx build --versions`
+VERSIONS_DIR = MKINX_DIR + "/versions"
+VERSIONS_RECORD = MKINX_DIR + "/versions.json"
+# Outputs of builds, by inputs' digest, shared by the versions' builds
+BUILD_CACHE_DIR = MKINX_DIR + "/cache"
+# `mkinx worker`'s default port, and the projects' sources it keeps
+WORKER_PORT = 8444
+WORKER_DIR = MKINX_DIR + "/worker"
+WORKER_KEEP = 16
+# `mkinx serve`'s live reload endpoints (see livereload.LiveReload)
+LIVE_ROUTE = "/_mkinx"
+# Imports of the projects' packages, and their cost (see mocks.detect_mocks)
+IMPORTS_RECORD = MKINX_DIR + "/imports.json"
+# Installed modules taking longer to import are mocked by autodoc, in seconds
+MOCK_IMPORT_COST = 0.2
+# The API pages written by `mkinx autodoc`, see apidoc.sync_stubs
+APIDOC_RECORD = MKINX_DIR + "/apidoc.json"
+# The files precompressed in each built site, see assets.precompress
+PRECOMPRESS_RECORD = MKINX_DIR + "/precompressed.json"
@@ -0,0 +1,133 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+from shutil import copy2
+
+from .conf import __VERSION__, EXPORT_MANIFEST
+from .server import RouteTable
+
+
+def link(source, destination):
+    """Hardlink source to destination, or copy it if the file system does
+    not support hardlinks (another device, FAT...)
+    """
+    temporary = "{}.{}.tmp".format(destination, os.getpid())
+    try:
+        os.link(source, temporary)
+    except OSError:
+        copy2(source, temporary)
+    os.replace(temporary, destination)
+
+
+def list_files(routes):
+    """Map each exported file to the file it comes from. Routes are applied
+    from the shortest to the longest so that, as when serving, the longest
+    route wins.
+
+    Args:
+        routes (list(list)): [url prefix, directory] of each route
+
+    Returns:
+        dict: source file of each exported file, by url path without its
+            leading "/"
+    """
+    files = {}
+    for prefix, location in sorted(routes, key=lambda r: len(r[0].strip("/"))):
+        prefix = prefix.strip("/")
+        for root, _, filenames in os.walk(location):
+            relative = os.path.relpath(root, location).replace(os.sep, "/")
+            for filename in filenames:
+                url = "/".join(p for p in (prefix, relative, filename) if p != ".")
+                files[url.strip("/")] = os.path.join(root, filename)
+    return files
+
+
+def export(dir_path, output):
+    """Assemble site/ and the listed projects' html, search index and shared
+    static files into one directory, laid out as `mkinx serve` serves them,
+    so that any static file server can serve it.
+
+    Files are hardlinked rather than copied. Exporting again only updates
+    what changed and removes the files of the previous export which are
+    gone.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+        output (pathlib.Path): the directory to export to
+
+    Returns:
+        dict: the export's manifest
+    """
+    table = RouteTable(dir_path)
+    routes = [["/", table.default]] + [
+        [prefix, location]
+        for prefix, location in table.routes()
+        if os.path.isdir(location)
+    ]
+    for _, location in routes:
+        if os.path.commonpath([str(output), location]) in {str(output), location}:
+            raise ValueError(
+                "{} can't be exported to {}: one contains the other".format(
+                    location, output
+                )
+            )
+
+    manifest_path = output / EXPORT_MANIFEST
+    try:
+        with open(manifest_path, "r") as f:
+            previous = json.load(f)["files"]
+    except (FileNotFoundError, ValueError, KeyError):
+        previous = {}
+
+    files = list_files(routes)
+    exported = {}
+    for url, source in sorted(files.items()):
+        destination = output / url
+        stat = os.stat(source)
+        exported[url] = {"size": stat.st_size, "mtime": stat.st_mtime}
+        if destination.exists() and os.path.samefile(source, str(destination)):
+            continue
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        link(source, str(destination))
+
+    for url in set(previous) - set(exported):
+        try:
+            os.remove(str(output / url))
+        except FileNotFoundError:
+            pass
+        # Remove the directories left empty
+        directory = (output / url).parent
+        while (
+            directory != output and directory.is_dir() and not any(directory.iterdir())
+        ):
+            directory.rmdir()
+            directory = directory.parent
+
+    manifest = {
+        "mkinx": __VERSION__,
+        "routes": {prefix: location for prefix, location in routes},
+        "immutable": [
+            prefix
+            for prefix in table.immutable_routes
+            if any(prefix == route + "/" for route, _ in routes)
+        ],
+        "files": exported,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
@@ -0,0 +1,179 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os
+import threading
+
+from mkdocs.commands.build import build
+from mkdocs.config import load_config
+from mkdocs.plugins import BasePlugin
+
+# mkdocs warns about dirty builds' navigation, which DirtyPages takes care of
+_DIRTY_WARNING = "A 'dirty' build is being performed"
+
+
+class _IgnoreDirtyWarning(logging.Filter):
+    def filter(self, record):
+        return not record.getMessage().startswith(_DIRTY_WARNING)
+
+
+logging.getLogger("mkdocs.commands.build").addFilter(_IgnoreDirtyWarning())
+
+
+class DirtyPages(BasePlugin):
+    """Fill in what mkdocs' dirty builds leave out, which only read and
+    render the pages modified since they were last written:
+        the titles of the other pages, read from their markdown so that
+            the navigation of the rendered pages is complete
+        the other pages' entries in the search index, kept from the
+            previous index
+
+    `titles_changed` tells whether a page's title changed, in which case
+    the other pages' navigation is outdated and the site must be fully
+    rebuilt.
+    """
+
+    def __init__(self):
+        self.dirty = False
+        self.titles = {}
+        self.titles_changed = False
+        self.rendered = set()
+        self.previous_index = None
+
+    def search_index_path(self, config):
+        return os.path.join(config.site_dir, "search", "search_index.json")
+
+    def on_pre_build(self, config):
+        self.rendered = set()
+        self.previous_index = None
+        if self.dirty:
+            try:
+                with open(self.search_index_path(config), "r") as f:
+                    self.previous_index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def on_nav(self, nav, config, files):
+        titles = {}
+        for file in files.documentation_pages():
+            page = file.page
+            if page is None:
+                continue
+            if page.markdown is None:
+                page.read_source(config)
+            titles[file.src_uri] = page.title
+        self.titles_changed = self.dirty and titles != self.titles
+        self.titles = titles
+        return nav
+
+    def on_page_context(self, context, page, config, nav):
+        self.rendered.add(page.url)
+        return context
+
+    def on_post_build(self, config):
+        if not self.dirty or self.previous_index is None:
+            return
+        path = self.search_index_path(config)
+        try:
+            with open(path, "r") as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        # Some search plugins merge the previous index themselves: only the
+        # rendered pages' entries of the new index are kept
+        def rendered(doc):
+            return doc["location"].split("#", 1)[0] in self.rendered
+
+        index["docs"] = [
+            doc for doc in self.previous_index.get("docs", []) if not rendered(doc)
+        ] + [doc for doc in index.get("docs", []) if rendered(doc)]
+        with open(path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+
+
+class HomeSite:
+    """Warm mkdocs builds of the Home Documentation, for long-lived
+    processes such as `mkinx serve`: mkdocs.yml, its theme and plugins are
+    loaded once, and again only when mkdocs.yml changes.
+
+    When docs/ holds the same files as at the last build, only the pages
+    whose markdown changed since they were written are rendered (mkdocs'
+    dirty builds, completed by DirtyPages) and the site's other files are
+    left untouched. Other changes call for a full build.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+    """
+
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        self.config_path = dir_path / "mkdocs.yml"
+        self.config = None
+        self.config_key = None
+        self.files_key = None
+        self.pages = DirtyPages()
+        self.lock = threading.Lock()
+
+    def get_config_key(self):
+        stat = self.config_path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_files_key(self):
+        docs_dir = self.config["docs_dir"]
+        return frozenset(
+            os.path.relpath(os.path.join(root, filename), docs_dir)
+            for root, _, filenames in os.walk(docs_dir)
+            for filename in filenames
+        )
+
+    def load(self):
+        if self.config is not None:
+            self.config.plugins.on_shutdown()
+        self.config = load_config(config_file=str(self.config_path))
+        self.config.plugins["mkinx-dirty-pages"] = self.pages
+        self.config.plugins.on_startup(command="build", dirty=True)
+        self.config_key = self.get_config_key()
+        self.files_key = None
+
+    def build(self):
+        """Build the site, only rendering the modified pages if possible
+
+        Returns:
+            bool: False if the build failed
+        """
+        with self.lock:
+            try:
+                if self.config is None or self.get_config_key() != self.config_key:
+                    self.load()
+                files_key = self.get_files_key()
+                self.pages.dirty = (
+                    files_key == self.files_key
+                    and (self.dir_path / "site" / "index.html").exists()
+                )
+                # Until it succeeds, the next build must be a full one
+                self.files_key = None
+                build(self.config, dirty=self.pages.dirty)
+                if self.pages.titles_changed:
+                    self.pages.dirty = False
+                    build(self.config)
+            except Exception as e:
+                print("mkdocs build failed: {}\n".format(e))
+                return False
+            self.files_key = files_key
+            return True
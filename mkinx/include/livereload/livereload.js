@@ -0,0 +1,26 @@
+/*
+ * mkinx serve's live reload client, injected into served pages.
+ *
+ * The page subscribes to the rebuilds of its own project (or of the Home
+ * Documentation) and reloads once one is done, then reports the reload
+ * so that the server can measure the edit-to-reload latency.
+ */
+(function () {
+    var key = "mkinx-reload";
+    var reloaded = sessionStorage.getItem(key);
+    if (reloaded) {
+        sessionStorage.removeItem(key);
+        fetch("/_mkinx/reloaded?id=" + encodeURIComponent(reloaded));
+    }
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource(
+        "/_mkinx/events?path=" + encodeURIComponent(location.pathname)
+    );
+    source.addEventListener("reload", function (event) {
+        source.close();
+        sessionStorage.setItem(key, event.data);
+        location.reload();
+    });
+})();
@@ -0,0 +1,114 @@
+/*
+ * mkinx's cross-project search client.
+ *
+ * The index built by `mkinx build` is sharded by the terms' first
+ * letters: a query only downloads the shards of its own words, and the
+ * documents tables of the projects it matched.
+ *
+ *     mkinxSearch("elastic search").then(function (results) {
+ *         // [{project: "/example_project", url: "...", title: "..."}]
+ *     });
+ */
+var mkinxSearch = (function () {
+    // The index is next to this script: /_search/, or /<version>/_search/
+    // for the versions built by `mkinx build --versions`
+    var script = document.currentScript;
+    var root = script ? new URL(".", script.src).pathname : "/_search/";
+    var home = root.replace(/_search\/$/, "");
+    var cache = {};
+
+    function load(path) {
+        if (!(path in cache)) {
+            cache[path] = fetch(root + path).then(function (response) {
+                return response.ok ? response.json() : {};
+            });
+        }
+        return cache[path];
+    }
+
+    function words(query) {
+        return query.toLowerCase().match(/\w+/g) || [];
+    }
+
+    // Sphinx stems its terms: "documentation" is indexed as "document"
+    function matches(term, word) {
+        return term.indexOf(word) === 0 || word.indexOf(term) === 0;
+    }
+
+    function docsOf(meta, hits) {
+        var projects = {};
+        hits.forEach(function (hit) {
+            projects[hit.project] = true;
+        });
+        var keys = Object.keys(projects);
+        return Promise.all(keys.map(function (key) {
+            return load(meta.docs[key]);
+        })).then(function (tables) {
+            var docs = {};
+            keys.forEach(function (key, i) {
+                docs[key] = tables[i];
+            });
+            return docs;
+        });
+    }
+
+    return function search(query) {
+        return load("meta.json").then(function (meta) {
+            var queryWords = words(query).filter(function (word) {
+                return word.length >= meta.prefix_length;
+            });
+            var prefixes = {};
+            queryWords.forEach(function (word) {
+                var prefix = word.slice(0, meta.prefix_length);
+                if (prefix in meta.shards) {
+                    prefixes[prefix] = load(meta.shards[prefix]);
+                }
+            });
+            var names = Object.keys(prefixes);
+            return Promise.all(names.map(function (name) {
+                return prefixes[name];
+            })).then(function (loaded) {
+                var shards = {};
+                names.forEach(function (name, i) {
+                    shards[name] = loaded[i];
+                });
+
+                // Documents matching every word of the query
+                var scores = {};
+                queryWords.forEach(function (word) {
+                    var shard = shards[word.slice(0, meta.prefix_length)] || {};
+                    var matched = {};
+                    Object.keys(shard).forEach(function (term) {
+                        if (!matches(term, word)) {
+                            return;
+                        }
+                        Object.keys(shard[term]).forEach(function (project) {
+                            shard[term][project].forEach(function (doc) {
+                                matched[project + "\n" + doc] = true;
+                            });
+                        });
+                    });
+                    Object.keys(matched).forEach(function (hit) {
+                        scores[hit] = (scores[hit] || 0) + 1;
+                    });
+                });
+                var hits = Object.keys(scores).filter(function (hit) {
+                    return scores[hit] === queryWords.length;
+                }).map(function (hit) {
+                    var parts = hit.split("\n");
+                    return {project: parts[0], doc: parseInt(parts[1], 10)};
+                });
+
+                return docsOf(meta, hits).then(function (docs) {
+                    return hits.map(function (hit) {
+                        var doc = docs[hit.project][hit.doc];
+                        var prefix = hit.project === "/"
+                            ? home
+                            : home + hit.project.slice(1) + "/";
+                        return {project: hit.project, url: prefix + doc[0], title: doc[1]};
+                    });
+                });
+            });
+        });
+    };
+})();
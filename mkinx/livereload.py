@@ -0,0 +1,238 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import posixpath
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, namedtuple
+from http import HTTPStatus
+from pathlib import Path
+
+from .conf import LIVE_ROUTE
+
+_CLIENT_PATH = Path(__file__).parent / "include" / "livereload" / "livereload.js"
+
+# A rebuild pages were told about: when the file event calling for it was
+# received and when it was done (time.monotonic)
+Rebuild = namedtuple("Rebuild", ["target", "edited", "rebuilt"])
+
+
+def percentile(values, fraction):
+    """The value below which `fraction` of the sorted `values` fall"""
+    if not values:
+        return None
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class LiveReload:
+    """Server-sent events telling the pages `mkinx serve` served to reload
+    once their project, or the Home Documentation, is rebuilt.
+
+    Pages load a small client (include/livereload/livereload.js), injected
+    before their </body>, which subscribes to /_mkinx/events with its path.
+    The path is routed like any request: a page is only told about the
+    rebuilds of the directory it is served from. Once reloaded, the page
+    reports it to /_mkinx/reloaded, and the time from the file event to
+    the reload is recorded (see `stats`, served at /_mkinx/stats).
+
+    Event streams are detached from the server's worker threads: a
+    connection stays open as long as its page, and would otherwise keep
+    a worker busy.
+
+    Args:
+        keepalive (float, optional): Defaults to 15. Seconds between the
+            comments sent to detect closed connections
+        history (int, optional): Defaults to 256. Number of rebuilds
+            remembered to match the reloads reported with
+    """
+
+    def __init__(self, keepalive=15, history=256):
+        with open(str(_CLIENT_PATH), "rb") as f:
+            self.snippet = b"<script>\n" + f.read() + b"</script>\n"
+        self.keepalive = keepalive
+        self.history = history
+        # {socket: location of the page}
+        self.clients = {}
+        self.rebuilds = OrderedDict()
+        self.count = 0
+        # [(edit to rebuilt, edit to reload)], in seconds
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.ping)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            clients, self.clients = self.clients, {}
+        for sock in clients:
+            sock.close()
+
+    def inject(self, content):
+        """Add the client to an html page's content"""
+        index = content.rfind(b"</body>")
+        if index < 0:
+            return content + self.snippet
+        return content[:index] + self.snippet + content[index:]
+
+    def owns(self, sock):
+        """Whether a connection is an event stream, which the server must
+        not close once its request is handled
+        """
+        with self.lock:
+            return sock in self.clients
+
+    def handle(self, handler):
+        """Answer a request to LIVE_ROUTE
+
+        Args:
+            handler (server.MkinxHTTPHandler): the request's handler
+        """
+        url = urllib.parse.urlsplit(handler.path)
+        query = urllib.parse.parse_qs(url.query)
+        endpoint = url.path[len(LIVE_ROUTE) :]
+        if endpoint == "/events":
+            path = posixpath.normpath(query.get("path", ["/"])[0])
+            segments = [s for s in path.split("/") if s and s not in {".", ".."}]
+            location, _ = handler.server.routes.match(segments)
+            self.subscribe(handler, location)
+        elif endpoint == "/reloaded":
+            self.reloaded(query.get("id", [""])[0])
+            handler.send_response(HTTPStatus.NO_CONTENT)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+        elif endpoint == "/stats":
+            body = json.dumps(self.stats(), indent=2).encode()
+            handler.send_response(HTTPStatus.OK)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.send_header("Cache-Control", "no-cache")
+            handler.end_headers()
+            handler.wfile.write(body)
+        else:
+            handler.send_error(HTTPStatus.NOT_FOUND)
+
+    def subscribe(self, handler, location):
+        handler.send_response(HTTPStatus.OK)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.wfile.write(b"retry: 1000\n\n")
+        handler.wfile.flush()
+        handler.close_connection = True
+        handler.connection.settimeout(5)
+        with self.lock:
+            self.clients[handler.connection] = location
+
+    def send(self, message, locations=None):
+        """Send a message to the pages served from `locations`, to all of
+        them if None, dropping the closed connections
+        """
+        with self.lock:
+            clients = [
+                sock
+                for sock, location in self.clients.items()
+                if locations is None or location in locations
+            ]
+        closed = []
+        for sock in clients:
+            try:
+                sock.sendall(message)
+            except OSError:
+                closed.append(sock)
+        with self.lock:
+            for sock in closed:
+                self.clients.pop(sock, None)
+        for sock in closed:
+            sock.close()
+        return len(clients) - len(closed)
+
+    def publish(self, location, edited=None):
+        """Tell the pages served from a directory to reload
+
+        Args:
+            location (str): the rebuilt directory, as routed by the server
+            edited (float, optional): Defaults to None. time.monotonic() of
+                the file event which called for the rebuild
+
+        Returns:
+            int: number of pages told
+        """
+        with self.lock:
+            self.count += 1
+            rebuild_id = str(self.count)
+            self.rebuilds[rebuild_id] = Rebuild(location, edited, time.monotonic())
+            while len(self.rebuilds) > self.history:
+                self.rebuilds.popitem(last=False)
+        message = "event: reload\ndata: {}\n\n".format(rebuild_id).encode()
+        return self.send(message, {location})
+
+    def reloaded(self, rebuild_id):
+        """Record the latency of a reload reported by a page"""
+        now = time.monotonic()
+        with self.lock:
+            rebuild = self.rebuilds.get(rebuild_id)
+            if rebuild is None or rebuild.edited is None:
+                return
+            self.latencies.append(
+                (rebuild.rebuilt - rebuild.edited, now - rebuild.edited)
+            )
+
+    def ping(self):
+        while not self.stopped.wait(self.keepalive):
+            self.send(b": ping\n\n")
+
+    def stats(self):
+        """Edit-to-rebuilt and edit-to-reload latencies' percentiles
+
+        Returns:
+            dict: the number of reloads and, for each latency, its median,
+                90th percentile and maximum in seconds
+        """
+        with self.lock:
+            latencies = list(self.latencies)
+            pages = len(self.clients)
+        stats = {"pages": pages, "reloads": len(latencies)}
+        for i, name in enumerate(["edit_to_rebuilt", "edit_to_reload"]):
+            values = sorted(latency[i] for latency in latencies)
+            stats[name] = {
+                "p50": percentile(values, 0.5),
+                "p90": percentile(values, 0.9),
+                "max": values[-1] if values else None,
+            }
+        return stats
+
+    def summary(self):
+        """str: the latencies' summary, printed when `mkinx serve` stops"""
+        stats = self.stats()
+        if not stats["reloads"]:
+            return "No page reloaded after a rebuild"
+        return (
+            "{} page reloads, edit to reload: median {:.0f} ms, p90 {:.0f} ms "
+            "(rebuild: median {:.0f} ms)".format(
+                stats["reloads"],
+                stats["edit_to_reload"]["p50"] * 1000,
+                stats["edit_to_reload"]["p90"] * 1000,
+                stats["edit_to_rebuilt"]["p50"] * 1000,
+            )
+        )
@@ -0,0 +1,298 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import sysconfig
+from importlib.util import find_spec
+
+from .conf import IMPORTS_RECORD, MOCK_IMPORT_COST
+
+# The conf.py line mkinx manages, see `set_mock_imports`
+MOCKS_MARKER = "# mkinx: mocked imports"
+_MOCKS_LINE = re.compile(
+    r"^autodoc_mock_imports = \[(.*)\]\s*" + re.escape(MOCKS_MARKER) + r"\s*$", re.M
+)
+_IMPORT_TIME = re.compile(r"^import time:\s*\d+ \|\s*(\d+) \| ( *)(\S+)$", re.M)
+
+
+def module_imports(path):
+    """The top-level names imported by a module when it is imported: the
+    imports within functions are left out, relative imports too
+
+    Args:
+        path (str): the module's path
+
+    Returns:
+        set(str): the imported top-level modules' names
+    """
+    with open(path, "rb") as f:
+        try:
+            tree = ast.parse(f.read(), path)
+        except (SyntaxError, ValueError):
+            return set()
+
+    names = set()
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            continue
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if not node.level and node.module:
+                names.add(node.module.split(".")[0])
+        else:
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def local_modules(project_path):
+    """Names a project's modules can be imported as: its package and what
+    conf.py puts on sys.path (the project's directory and its package's)
+    """
+    names = {project_path.name}
+    for directory in project_path, project_path / project_path.name:
+        if not directory.is_dir():
+            continue
+        for entry in os.scandir(str(directory)):
+            name, extension = os.path.splitext(entry.name)
+            if extension == ".py" or (
+                entry.is_dir()
+                and os.path.exists(os.path.join(entry.path, "__init__.py"))
+            ):
+                names.add(name)
+    return names
+
+
+def is_stdlib(name):
+    if name in sys.builtin_module_names or name == "__future__":
+        return True
+    stdlib_names = getattr(sys, "stdlib_module_names", None)
+    if stdlib_names is not None:
+        return name in stdlib_names
+    try:
+        spec = find_spec(name)
+    except (ImportError, ValueError):
+        return False
+    if spec is None or not spec.origin:
+        return False
+    stdlib = sysconfig.get_paths()["stdlib"]
+    return spec.origin.startswith(stdlib) and "site-packages" not in spec.origin
+
+
+def scan_project(project_path, record=None):
+    """Collect the third-party modules a project's package imports
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+        record (dict, optional): Defaults to None. {file: [mtime, size,
+            imports]} of a previous scan, updated with this one's: files
+            which did not change are not parsed again
+
+    Returns:
+        list(str): the sorted names of the imported third-party modules
+    """
+    record = {} if record is None else record
+    seen = set()
+    imports = set()
+    top = str(project_path)
+    for root, dirs, filenames in os.walk(top):
+        # The Sphinx scaffold and its outputs are only excluded at the
+        # project's top level, as in builder.project_inputs: a subpackage
+        # may be named build or source
+        dirs[:] = [
+            d
+            for d in dirs
+            if d != "__pycache__"
+            and not d.startswith(".")
+            and not (root == top and d in {"build", "source"})
+        ]
+        for filename in filenames:
+            if not filename.endswith(".py"):
+                continue
+            path = os.path.join(root, filename)
+            key = os.path.relpath(path, str(project_path))
+            stat = os.stat(path)
+            known = record.get(key)
+            if not known or known[:2] != [stat.st_mtime_ns, stat.st_size]:
+                known = record[key] = [
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    sorted(module_imports(path)),
+                ]
+            seen.add(key)
+            imports.update(known[2])
+    for key in set(record) - seen:
+        del record[key]
+
+    local = local_modules(project_path)
+    return sorted(n for n in imports if n not in local and not is_stdlib(n))
+
+
+def import_cost(name):
+    """Measure how long importing a module takes, in a new interpreter
+
+    Returns:
+        float: seconds, None if it can't be imported
+    """
+    try:
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import " + name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=60,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    if process.returncode:
+        return None
+    for cumulative, indent, module in _IMPORT_TIME.findall(process.stderr):
+        if module == name and not indent:
+            return int(cumulative) / 1e6
+    return 0.0
+
+
+def _module_key(name):
+    """What a module's cost depends on: where it is installed"""
+    try:
+        spec = find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None:
+        return None
+    origin = spec.origin or ""
+    try:
+        return "{}:{}".format(origin, os.stat(origin).st_mtime_ns)
+    except OSError:
+        return origin
+
+
+def load_record(dir_path):
+    """IMPORTS_RECORD: {"files": {project: {file: [mtime, size, imports]}},
+    "costs": {module: [install key, seconds]}, "detected": {project: mocks}}
+    """
+    try:
+        with open(dir_path / IMPORTS_RECORD, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_record(dir_path, record):
+    path = dir_path / IMPORTS_RECORD
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(record, f)
+
+
+def detect_mocks(project_path, record, threshold=MOCK_IMPORT_COST):
+    """The imports autodoc should mock for a project: its third-party
+    imports which are missing or take longer than `threshold` to import.
+
+    The imports of each file and the cost of each module are cached in
+    `record` (see `load_record`), the latter as long as the module's
+    install does not change.
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+        record (dict): the record to use and update
+        threshold (float, optional): Defaults to MOCK_IMPORT_COST. Seconds
+
+    Returns:
+        list(str): the sorted names of the modules to mock
+    """
+    files = record.setdefault("files", {}).setdefault(project_path.name, {})
+    costs = record.setdefault("costs", {})
+
+    mocks = []
+    for name in scan_project(project_path, files):
+        key = _module_key(name)
+        if key is None:
+            mocks.append(name)
+            continue
+        if costs.get(name, [None])[0] != key:
+            costs[name] = [key, import_cost(name)]
+        cost = costs[name][1]
+        if cost is None or cost >= threshold:
+            mocks.append(name)
+    record.setdefault("detected", {})[project_path.name] = mocks
+    return mocks
+
+
+def get_mock_imports(path_to_config):
+    """The imports listed on conf.py's line managed by mkinx
+
+    Returns:
+        list(str): the mocked imports, None if there is no such line
+    """
+    with open(str(path_to_config), "r") as f:
+        match = _MOCKS_LINE.search(f.read())
+    if match is None:
+        return None
+    return [m.strip().strip("\"'") for m in match.group(1).split(",") if m.strip()]
+
+
+def set_mock_imports(path_to_config, mocks):
+    """Write conf.py's `autodoc_mock_imports` line managed by mkinx,
+    replacing the previous one
+
+    Args:
+        path_to_config (pathlib.Path): the project's conf.py
+        mocks (list(str)): the imports to mock
+    """
+    line = "autodoc_mock_imports = [{}]  {}".format(
+        ", ".join('"{}"'.format(m) for m in mocks), MOCKS_MARKER
+    )
+    with open(str(path_to_config), "r") as f:
+        content = f.read()
+    if _MOCKS_LINE.search(content):
+        content = _MOCKS_LINE.sub(lambda _: line, content, count=1)
+    else:
+        content = content.rstrip("\n") + "\n\n" + line + "\n"
+    with open(str(path_to_config), "w") as f:
+        f.write(content)
+
+
+def refresh_mocks(project_path, dir_path):
+    """Update the mocked imports of a project whose conf.py has mkinx's
+    line (see `set_mock_imports`), if its imports changed. Imports which
+    were mocked on purpose (`mkinx autodoc -m`) remain mocked.
+
+    Returns:
+        bool: whether conf.py was updated
+    """
+    conf = project_path / "source" / "conf.py"
+    if not conf.exists():
+        return False
+    current = get_mock_imports(conf)
+    if current is None:
+        return False
+    record = load_record(dir_path)
+    previous = record.get("detected", {}).get(project_path.name, [])
+    detected = detect_mocks(project_path, record)
+    save_record(dir_path, record)
+    mocks = sorted((set(current) - set(previous)) | set(detected))
+    if mocks == sorted(current):
+        return False
+    set_mock_imports(conf, mocks)
+    return True
@@ -0,0 +1,198 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .conf import TRACE
+
+try:
+    import resource
+except ImportError:
+    # Windows: no CPU time of children nor RSS high-water mark
+    resource = None
+
+# Wall time, CPU time (of this process and its waited for children) and
+# RSS high-water mark (ru_maxrss of this process or of its largest child, in
+# kB) at some point
+Snapshot = namedtuple("Snapshot", ["time", "wall", "cpu", "max_rss"])
+
+# A timed phase of a build. max_rss is the process' RSS high-water mark once
+# the phase ended, rss_growth how much the phase raised it (phases running
+# concurrently raise it together)
+Phase = namedtuple(
+    "Phase",
+    ["name", "project", "start", "wall", "cpu", "max_rss", "pid", "tid", "rss_growth"],
+)
+
+
+def snapshot():
+    cpu = time.process_time()
+    max_rss = 0
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+        max_rss = max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children.ru_maxrss
+        )
+    return Snapshot(time.time(), time.perf_counter(), cpu, max_rss)
+
+
+class Tracer:
+    """Records the wall time, CPU time and memory (the growth of the
+    process' RSS high-water mark) of the phases of builds, to be exported
+    as a Chrome trace (chrome://tracing or https://ui.perfetto.dev) and
+    summarized in a table.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, project=None):
+        """Time the body of a with statement
+
+        Args:
+            name (str): the phase's name (mkdocs build, sphinx read...)
+            project (str, optional): Defaults to None. The project built
+        """
+        begin = snapshot()
+        try:
+            yield
+        finally:
+            self.record(name, project, begin, snapshot())
+
+    def record(self, name, project, begin, end):
+        """Record a phase which started and ended at some snapshots"""
+        phase = Phase(
+            name,
+            project,
+            begin.time,
+            end.wall - begin.wall,
+            end.cpu - begin.cpu,
+            end.max_rss,
+            os.getpid(),
+            threading.get_ident(),
+            end.max_rss - begin.max_rss,
+        )
+        with self.lock:
+            self.phases.append(phase)
+
+    def merge(self, phases):
+        """Add the phases recorded by another process (a build worker)"""
+        with self.lock:
+            self.phases += [Phase(*p) for p in phases if p[6] != os.getpid()]
+
+    def write_chrome_trace(self, path):
+        """Write the phases as Chrome trace events"""
+        events = [
+            {
+                "name": p.name,
+                "cat": p.project or "home",
+                "ph": "X",
+                "ts": int(p.start * 1e6),
+                "dur": int(p.wall * 1e6),
+                "pid": p.pid,
+                "tid": p.tid,
+                "args": {
+                    "project": p.project,
+                    "cpu_ms": round(p.cpu * 1000, 3),
+                    "process_max_rss_kb": p.max_rss,
+                    "rss_growth_kb": p.rss_growth,
+                },
+            }
+            for p in self.phases
+        ]
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        """Table of the phases, per project, sorted by wall time
+
+        Returns:
+            str: the table
+        """
+        totals = {}
+        for p in self.phases:
+            key = (p.name, p.project or "")
+            wall, cpu, growth, count = totals.get(key, (0, 0, 0, 0))
+            totals[key] = (wall + p.wall, cpu + p.cpu, growth + p.rss_growth, count + 1)
+
+        lines = [
+            "{:<24} {:<24} {:>6} {:>10} {:>10} {:>15}".format(
+                "phase", "project", "count", "wall (s)", "cpu (s)", "RSS growth (MB)"
+            )
+        ]
+        for (name, project), (wall, cpu, growth, count) in sorted(
+            totals.items(), key=lambda item: -item[1][0]
+        ):
+            lines.append(
+                "{:<24} {:<24} {:>6} {:>10.3f} {:>10.3f} {:>15.1f}".format(
+                    name, project, count, wall, cpu, growth / 1024
+                )
+            )
+        if self.phases:
+            lines.append(
+                "process RSS high-water mark: {:.1f} MB".format(
+                    max(p.max_rss for p in self.phases) / 1024
+                )
+            )
+        return "\n".join(lines)
+
+
+class NullTracer(Tracer):
+    """Tracer recording nothing, used unless --profile is set"""
+
+    @contextmanager
+    def phase(self, name, project=None):
+        yield
+
+    def record(self, name, project, begin, end):
+        pass
+
+
+tracer = NullTracer()
+
+
+def enable():
+    """Start recording phases in the module's tracer"""
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def is_enabled():
+    return not isinstance(tracer, NullTracer)
+
+
+def report(dir_path):
+    """Write the Chrome trace of the recorded phases and print their summary
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+    """
+    if not is_enabled():
+        return
+    path = dir_path / TRACE
+    tracer.write_chrome_trace(path)
+    print("\n" + tracer.summary())
+    print("\nTrace written to {} (open it in chrome://tracing)".format(path))
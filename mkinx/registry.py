@@ -0,0 +1,167 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import re
+import threading
+from pathlib import Path
+
+from .conf import HTML_LOCATION, PROJECT_KEY
+
+
+def parse_listed_projects(lines):
+    """Find the projects listed in the "# Projects" section of the Home
+    Documentation's index.md
+
+    Args:
+        lines (list(str)): index.md's lines
+
+    Returns:
+        set(str): projects' names, with the '/' in their beginings
+    """
+    listed_projects = set()
+    project_section = False
+    for _, l in enumerate(lines):
+        idx = l.find(PROJECT_KEY)
+        if idx >= 0:
+            project_section = True
+        if project_section:
+            # Find first parenthesis after the key
+            start = l.find("](")
+            if start > 0:
+                closing_parenthesis = sorted(
+                    [m.start() for m in re.finditer(r"\)", l) if m.start() > start]
+                )[0]
+                project = l[start + 2 : closing_parenthesis]
+                listed_projects.add(project)
+        # If the Projects section is over, stop iteration.
+        # It will stop before seeing ## but wainting for it
+        # Allows the user to use single # in the projects' descriptions
+        if len(listed_projects) > 0 and l.startswith("#"):
+            return listed_projects
+    return listed_projects
+
+
+class ProjectRegistry:
+    """The projects of a Home Documentation: the directories with a
+    source/ folder and the projects listed in docs/index.md, with their
+    routes and build locations.
+
+    Both are cached and only found again when the Home Documentation's
+    layout (its directories' mtimes) or index.md (its mtime and size)
+    changed, so that asking for them on every file event or request costs
+    a few stat calls. Use `get_registry` to share a registry.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+    """
+
+    def __init__(self, dir_path):
+        self.dir_path = Path(dir_path)
+        self.index_path = self.dir_path / "docs" / "index.md"
+        self.lock = threading.Lock()
+        self.layout_key = self.index_key = None
+        self._projects = frozenset()
+        self._listed = frozenset()
+
+    def get_layout_key(self):
+        with os.scandir(str(self.dir_path)) as entries:
+            return tuple(
+                sorted(
+                    (entry.name, entry.stat().st_mtime_ns)
+                    for entry in entries
+                    if entry.is_dir() and not entry.name.startswith(".")
+                )
+            )
+
+    def get_index_key(self):
+        try:
+            stat = self.index_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @property
+    def projects(self):
+        """set(str): names of the directories with a source/ folder"""
+        key = self.get_layout_key()
+        with self.lock:
+            if key != self.layout_key:
+                self._projects = frozenset(
+                    name
+                    for name, _ in key
+                    if os.path.isdir(os.path.join(str(self.dir_path), name, "source"))
+                )
+                self.layout_key = key
+            return set(self._projects)
+
+    @property
+    def listed(self):
+        """set(str): projects listed in index.md, with the '/' in their
+        beginings"""
+        key = self.get_index_key()
+        with self.lock:
+            if key != self.index_key:
+                if key is None:
+                    raise FileNotFoundError(str(self.index_path))
+                with open(self.index_path, "r") as index_file:
+                    self._listed = frozenset(
+                        parse_listed_projects(index_file.readlines())
+                    )
+                self.index_key = key
+            return set(self._listed)
+
+    def path(self, project):
+        """pathlib.Path: a project's directory"""
+        return self.dir_path / project.strip("/")
+
+    def html_location(self, project):
+        """pathlib.Path: the directory a project's html is built to"""
+        return self.path(project) / HTML_LOCATION
+
+    def routes(self):
+        """Routes to the listed projects' html
+
+        Returns:
+            list(list): list of routes, one route being:
+                [pattern to look for, absolute location]
+        """
+        return [
+            [p if p[0] == "/" else "/" + p, str(self.html_location(p))]
+            for p in sorted(self.listed)
+        ]
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(dir_path=None):
+    """The registry of a Home Documentation, shared by the commands, the
+    server and the watcher
+
+    Args:
+        dir_path (pathlib.Path, optional): Defaults to the current directory.
+            The Home Documentation's path
+
+    Returns:
+        ProjectRegistry: the Home Documentation's registry
+    """
+    dir_path = Path(dir_path or os.getcwd()).resolve()
+    with _registries_lock:
+        if dir_path not in _registries:
+            _registries[dir_path] = ProjectRegistry(dir_path)
+        return _registries[dir_path]
@@ -0,0 +1,155 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .conf import NEW_HOME_LINK, OFFLINE_ICONS_LINK, TO_REPLACE_WITH_HOME
+
+_TO_REPLACE_WITH_HOME = TO_REPLACE_WITH_HOME.encode()
+_NEW_HOME_LINK = NEW_HOME_LINK.encode()
+_OFFLINE_ICONS_LINK = OFFLINE_ICONS_LINK.encode()
+
+
+def _line_bounds(data, index):
+    start = data.rfind(b"\n", 0, index) + 1
+    end = data.find(b"\n", index)
+    return start, len(data) if end < 0 else end + 1
+
+
+def rewrite_html(path, home_link=False, offline=False):
+    """Apply mkinx's transforms to an html file in a single pass:
+        home_link: replace the first "view source" link with a link to
+            the Documentation's Home
+        offline: remove Google Fonts links, replacing the icons' with
+            the local material icons stylesheet
+
+    The lines to change are found with bytes searches rather than by
+    iterating over every line. Nothing is written, and the file's mtime
+    is preserved, unless a line changed.
+
+    Args:
+        path (str): the html file's path
+        home_link (bool, optional): Defaults to False
+        offline (bool, optional): Defaults to False
+
+    Returns:
+        bool: whether the file was rewritten
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # {line's start: (line's end, new line)}
+    edits = {}
+    if offline:
+        index = data.find(b"https://fonts")
+        while index >= 0:
+            start, end = _line_bounds(data, index)
+            line = data[start:end]
+            edits[start] = (end, _OFFLINE_ICONS_LINK if b"icon" in line else b"")
+            index = data.find(b"https://fonts", end)
+    if home_link:
+        index = data.find(_TO_REPLACE_WITH_HOME)
+        if index >= 0:
+            start, end = _line_bounds(data, index)
+            edits[start] = (end, _NEW_HOME_LINK)
+
+    pieces = []
+    position = 0
+    for start in sorted(edits):
+        end, new_line = edits[start]
+        if data[start:end] != new_line:
+            pieces += [data[position:start], new_line]
+            position = end
+    if not pieces:
+        return False
+    pieces.append(data[position:])
+    _replace(path, b"".join(pieces))
+    return True
+
+
+def _replace(path, data):
+    """Atomically replace a file's content, keeping its mode"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, os.stat(path).st_mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def rewrite_html_files(paths, home_link=False, offline=False, workers=None):
+    """Rewrite html files (see `rewrite_html`) in a pool of threads
+
+    Args:
+        paths (iterable(str)): the html files' paths
+        home_link (bool, optional): Defaults to False
+        offline (bool, optional): Defaults to False
+        workers (int, optional): Defaults to None. See ThreadPoolExecutor
+
+    Returns:
+        tuple: number of files rewritten and time it took, in seconds
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rewritten = sum(
+            executor.map(lambda p: rewrite_html(str(p), home_link, offline), paths)
+        )
+    return rewritten, time.perf_counter() - start
+
+
+def prefix_urls(path, prefix):
+    """Prefix the root-relative urls (href, src and css url()s starting
+    with a single "/") of an html or css file, for it to be served under
+    `prefix` instead of the server's root. Urls already under the prefix
+    are left as they are, so that files can be prefixed again.
+
+    Args:
+        path (str): the file's path
+        prefix (str): the url prefix, such as "/v1"
+
+    Returns:
+        bool: whether the file was rewritten
+    """
+    prefix = "/" + prefix.strip("/")
+    pattern = re.compile(
+        rb"""(\b(?:href|src|action)=["']|url\(\s*["']?)/(?!/|"""
+        + re.escape(prefix[1:].encode())
+        + rb"""(?:/|["')]))"""
+    )
+    with open(path, "rb") as f:
+        data = f.read()
+    rewritten = pattern.sub(lambda m: m.group(1) + prefix.encode() + b"/", data)
+    if rewritten == data:
+        return False
+    _replace(path, rewritten)
+    return True
+
+
+def prefix_urls_files(paths, prefix, workers=None):
+    """Prefix the urls of files (see `prefix_urls`) in a pool of threads
+
+    Returns:
+        int: number of files rewritten
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(lambda p: prefix_urls(str(p), prefix), paths))
@@ -0,0 +1,197 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import subprocess
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from shutil import rmtree
+from string import Template
+
+from . import apidoc
+from . import mocks as mock_imports
+from . import utils
+
+TEMPLATES = Path(__file__).resolve().parent / "include" / "autodoc"
+
+# Outcome of a project's autodoc: error is None if it succeeded
+AutodocResult = namedtuple("AutodocResult", ["project", "error"])
+
+# Projects are documented concurrently, their API pages in the same record
+apidoc_lock = threading.Lock()
+
+
+def find_projects(dir_path):
+    """Directories of the Home Documentation which contain a Python package
+    of the same name, as `mkinx autodoc` expects:
+    path/to/documentation/new_python_project/new_python_project/__init__.py
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+
+    Returns:
+        list(pathlib.Path): the projects' paths
+    """
+    return sorted(
+        Path(entry.path)
+        for entry in os.scandir(str(dir_path))
+        if entry.is_dir()
+        and not entry.name.startswith(".")
+        and os.path.exists(os.path.join(entry.path, entry.name, "__init__.py"))
+    )
+
+
+def has_scaffold(project_path):
+    return (project_path / "source" / "conf.py").exists()
+
+
+def clean(project_path):
+    """Remove a project's Sphinx scaffold and build, as `mkinx clean` does"""
+    rmtree(str(project_path / "source"), ignore_errors=True)
+    rmtree(str(project_path / "build"), ignore_errors=True)
+    for name in ("Makefile", "make.bat"):
+        try:
+            os.remove(str(project_path / name))
+        except FileNotFoundError:
+            pass
+
+
+def render(template, destination, **values):
+    with open(TEMPLATES / template, "r") as f:
+        content = Template(f.read()).safe_substitute(**values)
+    with open(destination, "w") as f:
+        f.write(content)
+
+
+def write_scaffold(project_path, author, windows=False):
+    """Write what `sphinx-quickstart` would for a project (separate source
+    and build directories, autodoc and viewcode), without asking anything
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+        author (str): the documentation's author
+        windows (bool, optional): Defaults to False. Write make.bat too
+    """
+    project = project_path.name
+    source = project_path / "source"
+    (source / "_static").mkdir(parents=True, exist_ok=True)
+    (source / "_templates").mkdir(exist_ok=True)
+
+    now = datetime.datetime.now()
+    title = "Welcome to {}'s documentation!".format(project)
+    values = {
+        "project": project,
+        "author": author,
+        "year": now.year,
+        "date": now.strftime("%a %b %d %H:%M:%S %Y"),
+        "underline": "=" * len(title),
+    }
+    render("conf.py", source / "conf.py", **values)
+    render("index.rst", source / "index.rst", **values)
+    render("Makefile", project_path / "Makefile", **values)
+    if windows:
+        render("make.bat", project_path / "make.bat", **values)
+
+
+def autodoc_project(project_path, author, mocks=None, windows=False, record=None):
+    """Write a project's Sphinx scaffold, configure it for mkinx and
+    generate the autodoc pages of its package and subpackages (see
+    apidoc.sync_stubs), which builds keep in sync with the package.
+    If anything fails, the project's scaffold is removed.
+
+    The package's third-party imports which are missing or slow to import
+    are mocked too (see mocks.detect_mocks), and kept up to date by builds.
+
+    Args:
+        project_path (pathlib.Path): the project's directory
+        author (str): the documentation's author
+        mocks (list(str), optional): Defaults to None. Imports to mock
+        windows (bool, optional): Defaults to False. Write make.bat too
+        record (dict, optional): Defaults to None. The imports' record to
+            use and update (see mocks.load_record), saved by the caller.
+            If None, it is loaded and saved here
+
+    Returns:
+        AutodocResult: the project and, if it failed, why
+    """
+    project = project_path.name
+    source = project_path / "source"
+    dir_path = project_path.parent
+    try:
+        write_scaffold(project_path, author, windows)
+        imports = mock_imports.load_record(dir_path) if record is None else record
+        detected = mock_imports.detect_mocks(project_path, imports)
+        if record is None:
+            mock_imports.save_record(dir_path, imports)
+        utils.set_sphinx_config(
+            source / "conf.py", project, sorted(set(mocks or []) | set(detected))
+        )
+        with apidoc_lock:
+            stubs = apidoc.load_record(dir_path)
+            stubs[project] = {}
+            apidoc.sync_stubs(project_path / project, source, stubs[project])
+            apidoc.save_record(dir_path, stubs)
+        utils.add_project_to_rst_index(source / "index.rst", project)
+    except Exception as e:
+        clean(project_path)
+        return AutodocResult(project, "{}: {}".format(type(e).__name__, e))
+    return AutodocResult(project, None)
+
+
+def autodoc_projects(project_paths, author, mocks=None, windows=False, jobs=None):
+    """Autodoc projects concurrently (see `autodoc_project`)
+
+    Args:
+        project_paths (list(pathlib.Path)): the projects' directories
+        author (str): the documentations' author
+        mocks (list(str), optional): Defaults to None. Imports to mock
+        windows (bool, optional): Defaults to False. Write make.bat too
+        jobs (int, optional): Defaults to None. See ThreadPoolExecutor
+
+    Returns:
+        list(AutodocResult): the projects' results, in order
+    """
+    if not project_paths:
+        return []
+    dir_path = project_paths[0].parent
+    record = mock_imports.load_record(dir_path)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(
+            executor.map(
+                lambda p: autodoc_project(p, author, mocks, windows, record),
+                project_paths,
+            )
+        )
+    mock_imports.save_record(dir_path, record)
+    return results
+
+
+def build(dir_path, projects, jobs=1):
+    """Build projects and the Home Documentation with `mkinx build`
+
+    Returns:
+        int: the build's return code
+    """
+    return subprocess.run(
+        [sys.executable, sys.argv[0], "build", "-F", "-j", str(jobs), "-p"]
+        + list(projects),
+        cwd=str(dir_path),
+        stdout=subprocess.DEVNULL,
+    ).returncode
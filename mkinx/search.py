@@ -0,0 +1,248 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from shutil import copyfile
+
+from . import utils
+from .conf import (
+    HTML_LOCATION,
+    SEARCH_CACHE_DIR,
+    SEARCH_DIR,
+    SEARCH_PREFIX_LENGTH,
+)
+
+# Key of the Home Documentation in the search index, projects being
+# keyed by their route
+HOME_KEY = "/"
+
+
+def load_sphinx_index(path):
+    """Parse a Sphinx searchindex.js file. Recent Sphinx versions write
+    JSON, older ones write it with unquoted keys (sphinx.util.jsdump).
+
+    Args:
+        path (pathlib.Path): the searchindex.js file
+
+    Returns:
+        dict: the index
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    content = content[content.find("(") + 1 : content.rfind(")")]
+    try:
+        return json.loads(content)
+    except ValueError:
+        from sphinx.util import jsdump
+
+        return jsdump.loads(content)
+
+
+def sphinx_contribution(path):
+    """Documents and terms of a Sphinx project's search index
+
+    Returns:
+        dict: {"docs": [[url, title]], "terms": {term: [doc indices]}}
+    """
+    index = load_sphinx_index(path)
+    docs = [
+        [docname + ".html", title]
+        for docname, title in zip(index["docnames"], index["titles"])
+    ]
+    terms = {}
+    for key in "terms", "titleterms":
+        for term, hits in index.get(key, {}).items():
+            hits = hits if isinstance(hits, list) else [hits]
+            terms.setdefault(term.lower(), set()).update(hits)
+    return {"docs": docs, "terms": {t: sorted(h) for t, h in terms.items()}}
+
+
+def mkdocs_contribution(path):
+    """Documents and terms of mkdoc's search index
+
+    Returns:
+        dict: {"docs": [[url, title]], "terms": {term: [doc indices]}}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    docs = []
+    terms = {}
+    for i, doc in enumerate(index["docs"]):
+        docs.append([doc["location"], doc["title"]])
+        text = re.sub(r"<[^>]*>", " ", doc["title"] + " " + doc["text"])
+        for term in set(re.findall(r"\w{2,}", text.lower())):
+            terms.setdefault(term, []).append(i)
+    return {"docs": docs, "terms": terms}
+
+
+def list_indexes(dir_path, projects):
+    """Find the search indexes to merge
+
+    Returns:
+        dict: {key: (index's path, function parsing it)}
+    """
+    indexes = {}
+    for name in "search/search_index.json", "mkdocs/search_index.json":
+        if (dir_path / "site" / name).exists():
+            indexes[HOME_KEY] = (dir_path / "site" / name, mkdocs_contribution)
+            break
+    for project in projects:
+        path = dir_path / project.strip("/") / HTML_LOCATION / "searchindex.js"
+        if path.exists():
+            indexes["/" + project.strip("/")] = (path, sphinx_contribution)
+    return indexes
+
+
+def prefix(term):
+    return term[:SEARCH_PREFIX_LENGTH]
+
+
+def file_name(text):
+    """Name of the file holding a shard or an index's documents, which
+    needs no escaping in urls
+
+    Args:
+        text (str): a shard's prefix or an index's key
+
+    Returns:
+        str: the file's name
+    """
+    text = text.strip("/") or "_home"
+    if re.fullmatch(r"[a-z0-9_]+", text):
+        return text + ".json"
+    return "_" + text.encode().hex() + ".json"
+
+
+def _load(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def _dump(path, data):
+    """Write json data unless the file already holds it
+
+    Returns:
+        bool: whether the file was written
+    """
+    content = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
+def build_search_index(dir_path, projects=None):
+    """Merge the search indexes of mkdoc's home and of the listed projects
+    into a single index, sharded by the terms' prefixes, which the browser
+    queries shard by shard (see include/search/search.js).
+
+    Each index's contribution is cached in SEARCH_CACHE_DIR with the stat
+    and hash of the index it was parsed from: only the shards holding terms
+    of the indexes which changed since the last build are rewritten.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+        projects (iterable(str), optional): Defaults to the projects listed
+            in the Home Documentation's index.md
+
+    Returns:
+        int: number of shards written
+    """
+    if projects is None:
+        projects = utils.get_listed_projects(dir_path)
+    output = dir_path / SEARCH_DIR
+    cache = dir_path / SEARCH_CACHE_DIR
+    for directory in output / "shards", output / "docs", cache:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    meta_path = output / "meta.json"
+    meta = _load(meta_path, None)
+    full = meta is None
+    contributions = {}
+    touched = set()
+    for key, (path, parse) in list_indexes(dir_path, projects).items():
+        cache_path = cache / file_name(key)
+        cached = _load(cache_path, {"digest": None, "stat": None, "terms": {}})
+        stat = os.stat(str(path))
+        stat = [stat.st_mtime_ns, stat.st_size]
+        if cached["stat"] == stat:
+            contributions[key] = cached
+            continue
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        if cached["digest"] == digest:
+            cached["stat"] = stat
+            _dump(cache_path, cached)
+            contributions[key] = cached
+            continue
+
+        contribution = parse(path)
+        contribution["digest"] = digest
+        contribution["stat"] = stat
+        contributions[key] = contribution
+        touched.update(prefix(t) for t in cached["terms"])
+        touched.update(prefix(t) for t in contribution["terms"])
+        _dump(cache_path, contribution)
+        _dump(output / "docs" / file_name(key), contribution["docs"])
+
+    # Indexes which disappeared (unlisted projects...)
+    for key in set((meta or {}).get("docs", {})) - set(contributions):
+        cache_path = cache / file_name(key)
+        touched.update(prefix(t) for t in _load(cache_path, {"terms": {}})["terms"])
+        for path in cache_path, output / "docs" / file_name(key):
+            if path.exists():
+                path.unlink()
+
+    shards = {}
+    for key, contribution in contributions.items():
+        for term, hits in contribution["terms"].items():
+            shard = prefix(term)
+            if full or shard in touched:
+                shards.setdefault(shard, {}).setdefault(term, {})[key] = hits
+
+    written = 0
+    for shard in touched - set(shards):
+        path = output / "shards" / file_name(shard)
+        if path.exists():
+            path.unlink()
+    for shard, terms in shards.items():
+        written += _dump(output / "shards" / file_name(shard), terms)
+
+    all_shards = set(shards) if full else set(meta["shards"]) - touched | set(shards)
+    _dump(
+        meta_path,
+        {
+            "prefix_length": SEARCH_PREFIX_LENGTH,
+            "shards": {s: "shards/" + file_name(s) for s in all_shards},
+            "docs": {k: "docs/" + file_name(k) for k in contributions},
+        },
+    )
+    include = Path(__file__).resolve().parent / "include" / "search"
+    for name in "search.js", "index.html":
+        copyfile(include / name, output / name)
+    return written
@@ -0,0 +1,438 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import email.utils
+import hashlib
+import io
+import os
+import posixpath
+import threading
+import urllib.parse
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+from . import assets, registry
+from .conf import LIVE_ROUTE, SEARCH_DIR, SEARCH_ROUTE, SHARED_DIR, SHARED_ROUTE
+
+
+class RouteTable:
+    """Routes url paths to the directories they are served from: each
+    listed project's build/html, the cross-project search index, the
+    projects' shared static files, the Home Documentation's site/ otherwise.
+    The versions built by `mkinx build --versions` are routed the same way
+    under /<version>/.
+
+    Routes are compiled into a trie of path segments, so that a lookup
+    costs the length of the path and the longest route wins whatever the
+    projects' names or nesting.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+        versions (bool, optional): Defaults to True. Whether to route the
+            built versions
+    """
+
+    def __init__(self, dir_path, versions=True):
+        self.dir_path = dir_path
+        self.versions = versions
+        self.registry = registry.get_registry(dir_path)
+        self.default = str(dir_path / "site")
+        self.refresh()
+
+    def routes(self):
+        """List the routes but the default one
+
+        Returns:
+            list(list): list of routes, one route being:
+                [pattern to look for, absolute location]
+        """
+        routes = []
+        if self.versions:
+            from .versions import load_versions
+
+            # The current tree's routes come last: they win over a version
+            # named after one of its projects
+            for name, version in sorted(load_versions(self.dir_path).items()):
+                home = Path(version["home"])
+                routes.append(["/" + name, str(home / "site")])
+                routes += [
+                    ["/" + name + pattern, location]
+                    for pattern, location in RouteTable(home, False).routes()
+                ]
+        routes += self.registry.routes()
+        routes.append([SEARCH_ROUTE, str(self.dir_path / SEARCH_DIR)])
+        routes.append([SHARED_ROUTE, str(self.dir_path / SHARED_DIR)])
+        return routes
+
+    def refresh(self):
+        """Compile the routes of the projects listed in the Home
+        Documentation's index.md, and of the built versions
+        """
+        routes = self.routes()
+        # Content-addressed files never change
+        self.immutable_routes = [
+            pattern + "/" for pattern, _ in routes if pattern.endswith(SHARED_ROUTE)
+        ]
+        self.immutable = tuple(
+            location + os.sep
+            for pattern, location in routes
+            if pattern.endswith(SHARED_ROUTE)
+        )
+        self.trie = self.compile(routes)
+
+    @staticmethod
+    def compile(routes):
+        trie = {}
+        for pattern, location in routes:
+            node = trie
+            for segment in pattern.strip("/").split("/"):
+                node = node.setdefault(segment, {})
+            # None can't be a segment: it holds the node's location
+            node[None] = location
+        return trie
+
+    def match(self, segments):
+        """Find the route of a path
+
+        Args:
+            segments (list(str)): the path's segments
+
+        Returns:
+            tuple: the route's location and the segments left to append
+                to it
+        """
+        location, depth = self.default, 0
+        node = self.trie
+        for i, segment in enumerate(segments):
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                location, depth = node[None], i + 1
+        return location, segments[depth:]
+
+
+# A file's content and validators, as served. mtime and size are the file's,
+# which the content may be derived from
+CachedFile = namedtuple("CachedFile", ["content", "etag", "mtime", "size"])
+
+# Appended to a page's path to key its entries with the live reload client
+LIVE_SUFFIX = "#live"
+
+
+class FileCache:
+    """Bounded LRU cache of served files' contents. Entries are keyed by
+    path and only used while the file's mtime and size did not change.
+
+    Args:
+        max_size (int, optional): Defaults to 64 MB. Maximum total size of
+            the cached contents, in bytes
+        max_file_size (int, optional): Defaults to 4 MB. Larger files are
+            read from disk on each request
+    """
+
+    def __init__(self, max_size=64 << 20, max_file_size=4 << 20):
+        self.max_size = max_size
+        self.max_file_size = min(max_file_size, max_size)
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, stat, key=None, transform=None):
+        """Get a file's content and validators
+
+        Args:
+            path (str): the file's path
+            stat (os.stat_result): the file's current stat
+            key (str, optional): Defaults to path. The entry's key, for
+                contents derived from the file
+            transform (callable, optional): Defaults to None. Derives the
+                cached content from the file's
+
+        Returns:
+            CachedFile: the file, or None if it is too large to be cached
+        """
+        key = key or path
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and (entry.mtime, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                self.entries.move_to_end(key)
+                return entry
+
+        if stat.st_size > self.max_file_size:
+            return None
+        with open(path, "rb") as f:
+            content = f.read()
+        if transform is not None:
+            content = transform(content)
+        etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+        entry = CachedFile(content, etag, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.size -= len(previous.content)
+            self.entries[key] = entry
+            self.size += len(entry.content)
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.content)
+        return entry
+
+    def invalidate(self, prefix):
+        """Drop the entries of the files in a directory
+
+        Args:
+            prefix (str): the directory's path
+        """
+        prefix = os.path.join(prefix, "")
+        with self.lock:
+            for path in [p for p in self.entries if p.startswith(prefix)]:
+                self.size -= len(self.entries.pop(path).content)
+
+
+class MkinxHTTPServer(HTTPServer):
+    """HTTP server handling each connection in a pool of worker threads, so
+    that a slow client or a large download does not block the others.
+
+    Args:
+        server_address (tuple): (host, port) to listen to
+        handler_class (type): class handling the requests
+        dir_path (pathlib.Path): the Home Documentation's path
+        workers (int, optional): Defaults to 16. Maximum number of
+            connections served concurrently
+        cache_size (int, optional): Defaults to 64 MB. Size of the cache of
+            served files, in bytes
+        live (livereload.LiveReload, optional): Defaults to None. Live
+            reload to inject into the served pages and to serve LIVE_ROUTE
+    """
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        server_address,
+        handler_class,
+        dir_path,
+        workers=16,
+        cache_size=64 << 20,
+        live=None,
+    ):
+        super().__init__(server_address, handler_class)
+        self.routes = RouteTable(dir_path)
+        self.cache = FileCache(cache_size)
+        self.live = live
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            # Event streams outlive their request
+            if self.live is None or not self.live.owns(request):
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+class MkinxHTTPHandler(SimpleHTTPRequestHandler):
+    """Class routing urls (paths) to projects (resources). Connections are
+    kept alive (HTTP/1.1) until they are idle for `timeout` seconds.
+
+    Files are served from the server's cache with strong ETags, and
+    conditional requests (If-None-Match, If-Modified-Since) are answered
+    with 304 Not Modified. Their precompressed variants are sent to the
+    clients accepting them.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = 5
+    # Headers and body are written separately: don't wait for the
+    # client's (delayed) ACK of the former to send the latter
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        live = self.server.live
+        if live is not None and self.path.startswith(LIVE_ROUTE + "/"):
+            live.handle(self)
+        else:
+            super().do_GET()
+
+    def translate_path(self, path):
+        # Same normalization as SimpleHTTPRequestHandler's, which
+        # keeps paths inside their route's directory
+        path = path.split("?", 1)[0].split("#", 1)[0]
+        trailing_slash = path.rstrip().endswith("/")
+        path = posixpath.normpath(urllib.parse.unquote(path))
+        segments = [s for s in path.split("/") if s and s not in {".", ".."}]
+
+        location, segments = self.server.routes.match(segments)
+        route = os.path.join(location, *segments)
+        if trailing_slash:
+            route += "/"
+        return route
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?", 1)[0].endswith("/"):
+            for index in "index.html", "index.htm":
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+        try:
+            stat = os.stat(path)
+            if os.path.isdir(path):
+                entry = None
+            elif self.server.live is not None and path.endswith(".html"):
+                entry, encoding = self.get_live_page(path, stat)
+            else:
+                variant, stat, encoding = self.negotiate(path, stat)
+                entry = self.server.cache.get(variant, stat)
+        except OSError:
+            entry = None
+        if entry is None:
+            # Redirections, listings, errors and large files
+            return super().send_head()
+
+        last_modified = self.date_time_string(entry.mtime / 1e9)
+        if self.is_not_modified(entry):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validators(entry.etag, last_modified, path)
+            self.end_headers()
+            return None
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(entry.content)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_validators(entry.etag, last_modified, path)
+        self.end_headers()
+        return io.BytesIO(entry.content)
+
+    def get_live_page(self, path, stat):
+        """Get a page with the live reload client injected, compressed with
+        the best encoding the client accepts. Each encoding of the page is
+        cached as its own entry, with its own ETag
+
+        Args:
+            path (str): the page's path
+            stat (os.stat_result): the page's stat
+
+        Returns:
+            tuple: the CachedFile, or None if the page is too large to be
+                cached, and its Content-Encoding
+        """
+        inject = self.server.live.inject
+        accepted = self.accepted_encodings()
+        compressors = assets.encoders()
+        for encoding, suffix in assets.ENCODINGS:
+            if encoding in accepted and suffix in compressors:
+                compress = compressors[suffix]
+                entry = self.server.cache.get(
+                    path,
+                    stat,
+                    key=path + LIVE_SUFFIX + suffix,
+                    transform=lambda content: compress(inject(content)),
+                )
+                return entry, encoding
+        return self.server.cache.get(path, stat, path + LIVE_SUFFIX, inject), None
+
+    def negotiate(self, path, stat):
+        """Pick the precompressed variant of a file (see
+        assets.precompress) which the client accepts, if it is up to date
+
+        Args:
+            path (str): the requested file's path
+            stat (os.stat_result): the requested file's stat
+
+        Returns:
+            tuple: the path and stat of the file to send and its
+                Content-Encoding, None for the file itself
+        """
+        accepted = self.accepted_encodings()
+        for encoding, suffix in assets.ENCODINGS:
+            if encoding in accepted:
+                try:
+                    variant_stat = os.stat(path + suffix)
+                except OSError:
+                    continue
+                if variant_stat.st_mtime_ns == stat.st_mtime_ns:
+                    return path + suffix, variant_stat, encoding
+        return path, stat, None
+
+    def accepted_encodings(self):
+        """The content codings of the request's Accept-Encoding"""
+        accepted = set()
+        for coding in self.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = coding.partition(";")
+            if params.replace(" ", "") not in {"q=0", "q=0.0", "q=0.00", "q=0.000"}:
+                accepted.add(name.strip().lower())
+        return accepted
+
+    def send_validators(self, etag, last_modified, path):
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        if path.startswith(self.server.routes.immutable):
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        else:
+            # Documentations change while being served: always revalidate
+            self.send_header("Cache-Control", "no-cache")
+        if os.path.splitext(path)[1] in assets.COMPRESSIBLE:
+            self.send_header("Vary", "Accept-Encoding")
+
+    def is_not_modified(self, entry):
+        """Evaluate the request's conditional headers, If-None-Match
+        taking precedence over If-Modified-Since
+
+        Args:
+            entry (CachedFile): the requested file
+
+        Returns:
+            bool: True if the client's copy is up to date
+        """
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            etags = [e.strip() for e in if_none_match.split(",")]
+            return "*" in etags or any(
+                e == entry.etag or e == "W/" + entry.etag for e in etags
+            )
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        modified = datetime.datetime.fromtimestamp(
+            entry.mtime // 10**9, datetime.timezone.utc
+        )
+        return modified <= since
@@ -0,0 +1,290 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from shutil import copyfileobj
+
+from .conf import SHARED_DIR, SHARED_RECORD, SHARED_ROUTE
+
+STATIC = "_static"
+
+# Precompressed variants are written next to their files (see assets)
+VARIANTS = (".gz", ".br")
+
+# Relative references of pages to static files, or to shared files they were
+# rewritten to by a previous build
+PAGE_REFERENCE = re.compile(
+    rb"""(?P<attribute>\b(?:href|src)=)(?P<quote>["'])"""
+    rb"""(?:(?P<relative>(?:\.\./)*_static/[^"'?#]+)[^"']*"""
+    rb"""|(?P<shared>""" + re.escape(SHARED_ROUTE.encode()) + rb"""/[^"'?#]+))"""
+    rb"""(?P=quote)"""
+)
+
+CSS_URL = re.compile(r"""url\(\s*(["']?)([^)"'?#]+)([^)"']*)\1\s*\)""")
+
+
+def hash_file(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def write_atomically(destination, write):
+    """Write a file in a temporary file of its own, which then replaces
+    destination: threads storing identical files do not collide
+
+    Args:
+        destination (str): the file's path
+        write (callable): writes the content to the binary file it is given
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        suffix=".tmp", dir=os.path.dirname(destination)
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            write(f)
+        # mkstemp creates files only their owner can read
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, destination)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def store_copy(source, destination):
+    """Copy source to destination, replacing it atomically"""
+    with open(source, "rb") as f:
+        write_atomically(destination, lambda temporary: copyfileobj(f, temporary))
+
+
+class SharedStore:
+    """Content-addressed store of the static files of the projects' html
+    documentations, served at SHARED_ROUTE.
+
+    Identical files are stored once, as copies of the projects' own files
+    (never links, which a later build writing the project's static files
+    would write through), and their urls only depend on their content:
+    pages referencing them through the store share the browser's cache
+    across projects and builds.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+    """
+
+    def __init__(self, dir_path):
+        self.root = dir_path / SHARED_DIR
+        self.record_path = dir_path / SHARED_RECORD
+        try:
+            with open(self.record_path, "r") as f:
+                self.records = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.records = {}
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.record_path, "w") as f:
+            json.dump(self.records, f)
+
+    def add(self, path):
+        """Store a copy of a file unless the store has one already
+
+        Returns:
+            str: the file's url
+        """
+        name = hash_file(path) + os.path.splitext(path)[1].lower()
+        stored = self.root / name
+        if not stored.exists():
+            store_copy(path, str(stored))
+        return SHARED_ROUTE + "/" + name
+
+    def add_content(self, content, extension):
+        """Store a file's content, such as a stylesheet rewritten to
+        reference the store
+
+        Returns:
+            str: the content's url
+        """
+        name = hashlib.sha1(content).hexdigest() + extension
+        stored = self.root / name
+        if not stored.exists():
+            write_atomically(str(stored), lambda f: f.write(content))
+        return SHARED_ROUTE + "/" + name
+
+    def share_static(self, project, html_path, workers=None):
+        """Store a project's static files and point its pages to them
+
+        Stylesheets with relative urls (fonts, images) are stored with
+        these urls pointing to the store too, or left out of it if one of
+        them can't be resolved within the static files.
+
+        Args:
+            project (str): the project's name
+            html_path (pathlib.Path): the project's built html
+            workers (int, optional): Defaults to None. See ThreadPoolExecutor
+
+        Returns:
+            int: number of pages rewritten
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        static = html_path / STATIC
+        files, stylesheets = [], []
+        for root, _, filenames in os.walk(str(static)):
+            for filename in filenames:
+                if filename.endswith(VARIANTS):
+                    continue
+                path = os.path.join(root, filename)
+                (stylesheets if filename.endswith(".css") else files).append(path)
+
+        def relative(path):
+            return os.path.relpath(path, str(html_path)).replace(os.sep, "/")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            urls = dict(zip(map(relative, files), executor.map(self.add, files)))
+        for path in stylesheets:
+            url = self.share_stylesheet(path, relative(path), urls)
+            if url:
+                urls[relative(path)] = url
+
+        record = self.records.get(project, {})
+        previous = {url: path for path, url in record.get("urls", {}).items()}
+        # Pages which did not change since they were last rewritten already
+        # reference the store, unless static files changed
+        known = record.get("pages", {}) if record.get("urls") == urls else {}
+        pages = {}
+        for root, dirs, filenames in os.walk(str(html_path)):
+            dirs[:] = [d for d in dirs if d not in {STATIC, "_sources"}]
+            for filename in filenames:
+                if filename.endswith(".html"):
+                    path = os.path.join(root, filename)
+                    pages[relative(path)] = os.stat(path).st_mtime_ns
+        stale = [page for page, mtime in pages.items() if known.get(page) != mtime]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rewritten = sum(
+                executor.map(
+                    lambda page: rewrite_page(
+                        str(html_path / page), page, urls, previous
+                    ),
+                    stale,
+                )
+            )
+        for page in stale:
+            pages[page] = os.stat(str(html_path / page)).st_mtime_ns
+        self.records[project] = {"urls": urls, "pages": pages}
+        return rewritten
+
+    def share_stylesheet(self, path, relative_path, urls):
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            content = f.read()
+        directory = posixpath.dirname(relative_path)
+        unresolved = []
+
+        def replace(match):
+            quote, target, suffix = match.groups()
+            # Absolute urls and data: uris
+            if target.startswith("/") or ":" in target:
+                return match.group(0)
+            url = urls.get(posixpath.normpath(posixpath.join(directory, target)))
+            if url is None:
+                unresolved.append(target)
+                return match.group(0)
+            return "url({0}{1}{2}{0})".format(quote, url, suffix)
+
+        rewritten = CSS_URL.sub(replace, content)
+        if unresolved:
+            return None
+        if rewritten == content:
+            return self.add(path)
+        return self.add_content(
+            rewritten.encode("utf-8", errors="surrogateescape"), ".css"
+        )
+
+    def collect_garbage(self, projects):
+        """Forget the projects which do not exist anymore and remove the
+        stored files no project references
+
+        Args:
+            projects (set): the Home Documentation's projects
+
+        Returns:
+            int: number of files removed
+        """
+        for project in set(self.records) - set(projects):
+            del self.records[project]
+        referenced = {
+            url.rsplit("/", 1)[1]
+            for record in self.records.values()
+            for url in record.get("urls", {}).values()
+        }
+        removed = 0
+        for entry in os.scandir(str(self.root)):
+            name = entry.name
+            for variant in VARIANTS:
+                if name.endswith(variant):
+                    name = name[: -len(variant)]
+            if name not in referenced:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+
+def rewrite_page(path, page, urls, previous):
+    """Point a page's references to static files to their shared urls
+
+    Args:
+        path (str): the page's path
+        page (str): the page's path relative to the project's html
+        urls (dict): shared url of each static file, by path relative to the
+            project's html
+        previous (dict): static file of each shared url the page may
+            reference from a previous build
+
+    Returns:
+        bool: whether the page was rewritten
+    """
+    directory = posixpath.dirname(page)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    def replace(match):
+        if match.group("shared"):
+            static = previous.get(match.group("shared").decode())
+        else:
+            static = posixpath.normpath(
+                posixpath.join(directory, match.group("relative").decode())
+            )
+        url = urls.get(static)
+        if url is None:
+            return match.group(0)
+        quote = match.group("quote")
+        return match.group("attribute") + quote + url.encode() + quote
+
+    rewritten = PAGE_REFERENCE.sub(replace, content)
+    if rewritten == content:
+        return False
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as f:
+        f.write(rewritten)
+    os.replace(temporary, path)
+    return True
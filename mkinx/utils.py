@@ -16,15 +16,12 @@
 
 import json
 import os
-import subprocess
 from pathlib import Path
-import re
 import time
-from watchdog.events import PatternMatchingEventHandler
 from shutil import copyfile
 
-from .conf import PROJECT_KEY, HTML_LOCATION, TO_REPLACE_WITH_HOME
-from .conf import NEW_HOME_LINK
+from . import registry, rewrite
+from .conf import PROJECT_KEY, HTML_LOCATION, OFFLINE_RECORD
 
 import fnmatch
 
@@ -78,160 +75,110 @@ def overwrite_view_source(project, dir_path):
     Args:
         project (str): project to update
         dir_path (pathlib.Path): this file's path
+
+    Returns:
+        tuple: number of files rewritten and time it took, in seconds
     """
 
     project_html_location = dir_path / project / HTML_LOCATION
     if not project_html_location.exists():
-        return
+        return 0, 0
 
     files_to_overwrite = [
         f for f in project_html_location.iterdir() if "html" in f.suffix
     ]
 
-    for html_file in files_to_overwrite:
-        with open(html_file, "r") as f:
-            html = f.readlines()
-        for i, l in enumerate(html):
-            if TO_REPLACE_WITH_HOME in l:
-                html[i] = NEW_HOME_LINK
-                break
-        with open(html_file, "w") as f:
-            f.writelines(html)
+    return rewrite.rewrite_html_files(files_to_overwrite, home_link=True)
 
 
-def get_listed_projects():
-    """Find the projects listed in the Home Documentation's
-    index.md file
+def get_projects(dir_path):
+    """Find the projects in the Home Documentation's folder: directories
+    with a source/ folder
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
 
     Returns:
-        set(str): projects' names, with the '/' in their beginings
+        set(str): projects' names
     """
-    index_path = Path().resolve() / "docs" / "index.md"
-    with open(index_path, "r") as index_file:
-        lines = index_file.readlines()
+    return registry.get_registry(dir_path).projects
 
-    listed_projects = set()
-    project_section = False
-    for _, l in enumerate(lines):
-        idx = l.find(PROJECT_KEY)
-        if idx >= 0:
-            project_section = True
-        if project_section:
-            # Find first parenthesis after the key
-            start = l.find("](")
-            if start > 0:
-                closing_parenthesis = sorted(
-                    [m.start() for m in re.finditer(r"\)", l) if m.start() > start]
-                )[0]
-                project = l[start + 2 : closing_parenthesis]
-                listed_projects.add(project)
-        # If the Projects section is over, stop iteration.
-        # It will stop before seeing ## but wainting for it
-        # Allows the user to use single # in the projects' descriptions
-        if len(listed_projects) > 0 and l.startswith("#"):
-            return listed_projects
-    return listed_projects
-
-
-def set_routes():
-    """Set the MKINX_ROUTES environment variable with a serialized list
-    of list of routes, one route being:
-        [pattern to look for, absolute location]
-    """
-    os.system("pwd")
-    dir_path = Path(os.getcwd()).absolute()
-    projects = get_listed_projects()
-    routes = [
-        [p if p[0] == "/" else "/" + p, str(dir_path) + "{}/build/html".format(p)]
-        for p in projects
-    ]
-    os.environ["MKINX_ROUTES"] = json.dumps(routes)
 
+def get_listed_projects(dir_path=None):
+    """Find the projects listed in the Home Documentation's
+    index.md file
 
-def get_routes():
-    """Parse routes from environment.
+    Args:
+        dir_path (pathlib.Path, optional): Defaults to the current
+            directory. The Home Documentation's path
 
     Returns:
-        list(list): list of routes, one route being:
-            [pattern to look for, absolute location]
+        set(str): projects' names, with the '/' in their beginings
     """
-    return json.loads(os.getenv("MKINX_ROUTES", "[[]]"))
+    return registry.get_registry(dir_path).listed
 
 
-class MkinxFileHandler(PatternMatchingEventHandler):
-    """Class handling file changes:
-        .md: The Home Documentation has been modified
-            -> mkdocs build
-        .rst: A project's sphinx documentation has been modified
-            -> mkinx build -F -p {project}
-    """
+def make_offline(dir_path=None, projects=(), site=True):
+    """Deletes references to the external google fonts in the Home
+    Documentation's index.html files and in the projects' html files.
 
-    def on_any_event(self, event):
-        set_routes()
+    The conversion is incremental: the stats of the converted files are
+    recorded in OFFLINE_RECORD and only files which were written since
+    (by the last mkdocs or Sphinx build) are converted again.
 
-        offline = ""
-        if event.src_path.split(".")[-1] in {"md", "yml", "yaml"}:
-            try:
-                _ = subprocess.check_output("mkdocs build > /dev/null", shell=True)
-            except subprocess.CalledProcessError as e:
-                print(e, "\n")
-            if json.loads(os.getenv("MKINX_OFFLINE", "false")):
-                make_offline()
-
-        if event.src_path.split(".")[-1] == "rst":
-            # src_path:
-            # /Users/you/Documents/YourDocs/example_project/source/index.md
-            # os.getcwd():
-            # /Users/you/Documents/YourDocs
-            # relative_path:
-            # /example_project/docs/index.md
-            # project: example_project
-
-            relative_path = event.src_path.split(os.getcwd())[-1]
-            project = relative_path.split("/")[1]
-            if json.loads(os.getenv("MKINX_OFFLINE", "false")):
-                offline = "--offline"
-            os.system("mkinx build -F {} -p {} > /dev/null".format(offline, project))
-
-
-def make_offline():
-    """Deletes references to the external google fonts in the Home
-    Documentation's index.html file
+    Args:
+        dir_path (pathlib.Path, optional): Defaults to the current
+            directory. The Home Documentation's path
+        projects (iterable(str), optional): Defaults to (). Projects whose
+            built html files should be converted too
+        site (bool, optional): Defaults to True. Convert mkdoc's site
+
+    Returns:
+        int: number of files converted
     """
-    dir_path = Path(os.getcwd()).absolute()
+    dir_path = dir_path or Path(os.getcwd()).absolute()
 
     css_path = dir_path / "site" / "assets" / "stylesheets"
     material_css = css_path / "material-style.css"
-    if not material_css.exists():
-        file_path = Path(__file__).resolve().parent
+    if site and css_path.exists() and not material_css.exists():
+        file_path = Path(__file__).resolve().parent / "include"
         copyfile(file_path / "material-style.css", material_css)
         copyfile(file_path / "material-icons.woff2", css_path / "material-icons.woff2")
 
-    indexes = []
-    for root, _, filenames in os.walk(dir_path / "site"):
-        for filename in fnmatch.filter(filenames, "index.html"):
-            indexes.append(os.path.join(root, filename))
-    for index_file in indexes:
-        update_index_to_offline(index_file)
-
-
-def update_index_to_offline(path):
-    with open(path, "r") as f:
-        lines = f.readlines()
-    new_lines = []
-    for l in lines:
-        if "https://fonts" in l:
-            if "icon" in l:
-                new_lines.append(
-                    '<link rel="stylesheet"'
-                    + " href=/assets/stylesheets/material-style.css>"
-                )
-            elif "css" in l:
-                pass
-        else:
-            new_lines.append(l)
-    with open(path, "w") as f:
-        f.writelines(new_lines)
+    roots = [(dir_path / "site", "index.html")] if site else []
+    roots += [(dir_path / p / HTML_LOCATION, "*.html") for p in projects]
+
+    record_path = dir_path / OFFLINE_RECORD
+    try:
+        with open(record_path, "r") as f:
+            record = json.load(f)
+    except (FileNotFoundError, ValueError):
+        record = {}
+
+    stale = []
+    for root, pattern in roots:
+        prefix = os.path.relpath(str(root), str(dir_path)) + os.sep
+        seen = set()
+        for directory, _, filenames in os.walk(str(root)):
+            for filename in fnmatch.filter(filenames, pattern):
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, str(dir_path))
+                seen.add(key)
+                stat = os.stat(path)
+                if record.get(key) != [stat.st_mtime_ns, stat.st_size]:
+                    stale.append((key, path))
+        for key in [k for k in record if k.startswith(prefix) and k not in seen]:
+            del record[key]
+
+    rewrite.rewrite_html_files([path for _, path in stale], offline=True)
+    for key, path in stale:
+        stat = os.stat(path)
+        record[key] = [stat.st_mtime_ns, stat.st_size]
+
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(record_path, "w") as f:
+        json.dump(record, f)
+    return len(stale)
 
 
 def set_sphinx_config(path_to_config, project_name, mocks):
@@ -262,44 +209,25 @@ def set_sphinx_config(path_to_config, project_name, mocks):
     extended_conf += "    'collapse_navigation': False\n"
     extended_conf += "}\n"
     extended_conf += "\nautoclass_content = 'both'\n"
-    if mocks:
-        extended_conf += "\nautodoc_mock_imports = [{}]\n".format(
-            ", ".join('"{}"'.format(m) for m in mocks)
-        )
 
     new_lines.append(extended_conf)
 
     with path.open("w") as f:
         f.write("".join(new_lines))
 
+    # Kept up to date by builds, see mocks.refresh_mocks
+    from .mocks import set_mock_imports
 
-def create_rst_for_package(package_path, source_path):
-    title = "``{}``".format(package_path.name)
-    header = "{}\n{}\n{}\n\n\n".format("*" * len(title), title, "*" * len(title))
-
-    body = (
-        "This is the package's auto-documentation generated by ``mkinx``"
-        + " using ``sphinx``'s ``autodoc``.\nYou may edit this .rst file.\n\n"
-    )
-
-    module_names = [
-        m.name
-        for m in package_path.iterdir()
-        if m.suffix == ".py" and "__" not in m.name
-    ]
+    set_mock_imports(path, mocks or [])
 
-    for m in module_names:
-        sub_body = m.capitalize()
-        sub_body += "\n{}\n\n".format("=" * len(sub_body))
-        sub_body += ".. automodule:: {}.{}\n".format(
-            package_path.name, m.split(".py")[0]
-        )
-        sub_body += "   :members:\n\n"
-        body += sub_body
 
-    filename = package_path.name + ".rst"
-    with open(source_path / filename, "w") as f:
-        f.write(header + body)
+def create_rst_for_package(package_path, source_path):
+    """Write the .rst pages of a package, its subpackages and their modules
+    (see apidoc.sync_stubs)
+    """
+    from . import apidoc
+
+    apidoc.sync_stubs(Path(package_path), Path(source_path), {})
 
 
 def add_project_to_rst_index(index_path, project_name):
@@ -357,21 +285,3 @@ def add_project_to_doc_index(index_path, project_name):
         new_lines.append(l)
     with open(index_path, "w") as f:
         f.write("".join([l for l in new_lines if l]))
-
-
-def remove_project_name_from_titles(source_path):
-    path = Path(source_path)
-    for fname in path.iterdir():
-        if fname.is_file() and fname.suffix == ".rst":
-            with open(fname, "r") as f:
-                lines = f.readlines()
-
-            if "==" in lines[1]:
-                no_package_or_modules = lines[0].split(" ")[0]
-                no_path = no_package_or_modules.split(".")[-1]
-                formatted = "``{}``".format(no_path).replace("\_", "_")
-                lines[0] = formatted + "\n"
-                lines[1] = "=" * len(formatted) + "\n"
-
-            with open(fname, "w") as f:
-                f.write("".join(lines))
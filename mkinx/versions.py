@@ -0,0 +1,215 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from . import assets, registry, rewrite, utils
+from .conf import (
+    BUILD_CACHE_DIR,
+    MKINX_DIR,
+    SEARCH_DIR,
+    SHARED_DIR,
+    VERSIONS_DIR,
+    VERSIONS_RECORD,
+)
+
+
+def version_name(ref):
+    """The name of a git ref's version, used as its directory's name and
+    url prefix: "release/1.2" is served at /release-1.2/
+    """
+    return re.sub(r"[^\w.-]+", "-", ref).strip("-.")
+
+
+def load_versions(dir_path):
+    """The versions built by `mkinx build --versions`
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+
+    Returns:
+        dict: {name: {"ref", "commit", "home"}}, "home" being the path of
+            the version's Home Documentation
+    """
+    try:
+        with open(dir_path / VERSIONS_RECORD, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def git(args, cwd):
+    return subprocess.check_output(
+        ["git"] + args, cwd=str(cwd), stderr=subprocess.STDOUT, universal_newlines=True
+    ).strip()
+
+
+def checkout(dir_path, ref):
+    """Materialize a git ref as a worktree in VERSIONS_DIR, or move the
+    ref's existing worktree to its current commit
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path, in a git
+            repository
+        ref (str): a branch, tag or commit
+
+    Returns:
+        tuple: the ref's commit and the path of the version's Home
+            Documentation
+    """
+    toplevel = Path(git(["rev-parse", "--show-toplevel"], dir_path)).resolve()
+    commit = git(["rev-parse", "--verify", ref + "^{commit}"], dir_path)
+    worktree = dir_path / VERSIONS_DIR / version_name(ref)
+    if (worktree / ".git").exists():
+        git(["checkout", "--detach", "--force", commit], worktree)
+    else:
+        git(["worktree", "add", "--detach", "--force", str(worktree), commit], dir_path)
+    return commit, worktree / dir_path.resolve().relative_to(toplevel)
+
+
+def prefix_outputs(home, prefix):
+    """Prefix the root-relative urls of a version's pages, search page and
+    shared stylesheets, for it to be served under `prefix`
+
+    Args:
+        home (pathlib.Path): the version's Home Documentation's path
+        prefix (str): the version's url prefix
+
+    Returns:
+        int: number of files rewritten
+    """
+    projects = registry.get_registry(home)
+    roots = [home / "site", home / SEARCH_DIR] + [
+        projects.html_location(p) for p in sorted(projects.listed)
+    ]
+    files = []
+    for root in roots:
+        for directory, dirs, filenames in os.walk(str(root)):
+            dirs[:] = [d for d in dirs if d not in {"_static", "_sources"}]
+            files += [
+                os.path.join(directory, f) for f in filenames if f.endswith(".html")
+            ]
+    shared = home / SHARED_DIR
+    if shared.is_dir():
+        files += [e.path for e in os.scandir(str(shared)) if e.name.endswith(".css")]
+        roots.append(shared)
+
+    rewritten = rewrite.prefix_urls_files(files, prefix)
+    for root in roots:
+        if root.is_dir():
+            assets.precompress(root, home=home)
+    return rewritten
+
+
+def build_version(home, name, options, cache):
+    """Build a version's Home Documentation with `mkinx build` and prefix
+    its urls
+
+    Returns:
+        tuple: the build's return code and output
+    """
+    process = subprocess.run(
+        [sys.executable, sys.argv[0], "build", "-A", "-F"] + options,
+        cwd=str(home),
+        env=dict(os.environ, MKINX_BUILD_CACHE=str(cache)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    if (home / "site" / "index.html").exists():
+        prefix_outputs(home, "/" + name)
+    return process.returncode, process.stdout
+
+
+def build_versions(dir_path, refs, jobs=1, clean=False, offline=False, verbose=False):
+    """Build the Home Documentation as of several git refs, concurrently.
+    Each version's outputs are served (and exported) under /<version>/.
+
+    The versions' builds share a build cache (see `builder.BuildCache`):
+    projects, and the home documentation, whose inputs did not change
+    between versions are only built once.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path, in a git
+            repository
+        refs (list(str)): the git refs to build
+        jobs (int, optional): Defaults to 1. Concurrent builds per version
+        clean (bool, optional): Defaults to False. See `mkinx build -c`
+        offline (bool, optional): Defaults to False. See `mkinx build --offline`
+        verbose (bool, optional): Defaults to False. Print the builds' output
+
+    Returns:
+        list(str): the versions whose build failed
+    """
+    (dir_path / MKINX_DIR).mkdir(exist_ok=True)
+    # Keep the worktrees and caches out of the repository's status
+    with open(dir_path / MKINX_DIR / ".gitignore", "w") as f:
+        f.write("*\n")
+
+    failed = []
+    homes = {}
+    for ref in refs:
+        name = version_name(ref)
+        try:
+            homes[name] = (ref,) + checkout(dir_path, ref)
+        except subprocess.CalledProcessError as e:
+            print(
+                "{}Can't check {} out:{} {}".format(
+                    utils.colors.FAIL, ref, utils.colors.ENDC, e.output.strip()
+                )
+            )
+            failed.append(name)
+
+    options = ["-j", str(jobs)]
+    options += ["-c"] if clean else []
+    options += ["--offline"] if offline else []
+    versions = load_versions(dir_path)
+    with ThreadPoolExecutor(max_workers=max(len(homes), 1)) as executor:
+        futures = {
+            executor.submit(
+                build_version, home, name, options, dir_path / BUILD_CACHE_DIR
+            ): name
+            for name, (_, _, home) in homes.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            ref, commit, home = homes[name]
+            returncode, output = future.result()
+            if verbose or returncode:
+                print(output)
+            if returncode:
+                failed.append(name)
+            print(
+                "{}{} ({}){} {}".format(
+                    utils.colors.FAIL if returncode else utils.colors.OKGREEN,
+                    name,
+                    commit[:8],
+                    utils.colors.ENDC,
+                    "failed" if returncode else "built at /{}/".format(name),
+                )
+            )
+            if (home / "site" / "index.html").exists():
+                versions[name] = {"ref": ref, "commit": commit, "home": str(home)}
+
+    with open(dir_path / VERSIONS_RECORD, "w") as f:
+        json.dump(versions, f, indent=2)
+    return failed
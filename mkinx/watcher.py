@@ -0,0 +1,358 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import subprocess
+import threading
+import time
+import traceback
+
+from watchdog.events import PatternMatchingEventHandler
+
+from . import assets, builder, profiling, registry, search, utils
+from .conf import SEARCH_DIR
+
+# Target standing for mkdoc's Home Documentation in a RebuildScheduler
+HOME = None
+# Events changing files. Builds read their inputs, and recent watchdog
+# versions report reads (opened, closed...) too
+CHANGE_EVENTS = {"created", "deleted", "modified", "moved"}
+
+
+class MkinxFileHandler(PatternMatchingEventHandler):
+    """Class handling file changes:
+        .md: The Home Documentation has been modified
+            -> mkdocs build, in-process if the scheduler has a HomeSite
+        .rst: A project's sphinx documentation has been modified
+            -> the project is rebuilt with its warm Sphinx application
+
+    Rebuilds are not run by the handler but by a scheduler which coalesces
+    bursts of events.
+
+    Args:
+        scheduler (RebuildScheduler): scheduler running the rebuilds
+    """
+
+    def __init__(self, scheduler, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+        self.received = 0
+        self.used = 0
+
+    def dispatch(self, event):
+        self.received += 1
+        super().dispatch(event)
+
+    def on_any_event(self, event):
+        if event.event_type not in CHANGE_EVENTS:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        targets = {self.get_target(p) for p in paths if p} - {False}
+        if targets:
+            self.used += 1
+        for target in targets:
+            self.scheduler.notify(target)
+
+    @property
+    def filtered(self):
+        """Number of events which did not call for a rebuild"""
+        return self.received - self.used
+
+    def get_target(self, path):
+        """Find which target a changed file belongs to. Build outputs
+        (build/, site/...) never call for a rebuild.
+
+        Args:
+            path (str): the changed file's path
+
+        Returns:
+            str, None or bool: the project to rebuild, HOME or False if
+                nothing has to be rebuilt
+        """
+        # path:
+        # /Users/you/Documents/YourDocs/example_project/source/index.rst
+        # scheduler.dir_path:
+        # /Users/you/Documents/YourDocs
+        # relative_path:
+        # example_project/source/index.rst
+        # project: example_project
+        relative_path = os.path.relpath(path, str(self.scheduler.dir_path))
+        parts = relative_path.split(os.sep)
+        # Outputs are only excluded at the top level of the Home
+        # Documentation and of the projects: a package may have a build/
+        if any(p == ".." or builder.is_cache_dir(p) for p in parts[:-1]):
+            return False
+        if is_output_dir(parts[0]) or (
+            parts[0] != "docs" and len(parts) > 2 and is_output_dir(parts[1])
+        ):
+            return False
+
+        extension = path.split(".")[-1]
+        if parts[0] == "docs" or relative_path == "mkdocs.yml":
+            if extension in {"md", "yml", "yaml"}:
+                return HOME
+            return False
+
+        if extension in {"rst", "py"} and len(parts) > 1:
+            return parts[0]
+
+        return False
+
+
+def is_output_dir(name):
+    """Whether a top-level directory of the Home Documentation or of a
+    project holds build outputs or mkinx's state
+    """
+    return name in builder.IGNORED_DIRS or builder.is_cache_dir(name) or name == ".."
+
+
+class InputWatches:
+    """Per-directory watches on the inputs of the builds only: docs/,
+    mkdocs.yml and each project's directories but build/ (its source/
+    and its package). This way, files written by the builds themselves
+    do not come back as events.
+
+    Args:
+        observer (watchdog.observers.Observer): observer to schedule the
+            watches with
+        handler (MkinxFileHandler): handler of the watches' events
+        dir_path (pathlib.Path): the Home Documentation's path
+    """
+
+    def __init__(self, observer, handler, dir_path):
+        self.observer = observer
+        self.handler = handler
+        self.dir_path = dir_path
+        self.registry = registry.get_registry(dir_path)
+        self.watches = {}
+
+    def inputs(self):
+        """List the directories to watch
+
+        Returns:
+            dict: whether to watch each directory's subdirectories too
+        """
+        # Non recursive: mkdocs.yml and new projects
+        inputs = {str(self.dir_path): False, str(self.dir_path / "docs"): True}
+        for project in self.registry.projects:
+            for path in self.registry.path(project).iterdir():
+                if path.is_dir() and not is_output_dir(path.name):
+                    inputs[str(path)] = True
+        return inputs
+
+    def sync(self):
+        """Watch new projects and stop watching deleted ones"""
+        inputs = {
+            path: recursive
+            for path, recursive in self.inputs().items()
+            if os.path.isdir(path)
+        }
+        for path in set(self.watches) - set(inputs):
+            self.observer.unschedule(self.watches.pop(path))
+        for path, recursive in inputs.items():
+            if path not in self.watches:
+                self.watches[path] = self.observer.schedule(
+                    self.handler, path, recursive=recursive
+                )
+
+
+class RebuildScheduler:
+    """Debounces file events and runs the rebuilds they call for in a
+    background thread.
+
+    Events are grouped until none arrived for `debounce` seconds. The
+    group's projects and the Home Documentation are then rebuilt once
+    each, one at a time. A target notified again while its group is
+    being built is dropped from that group: it is superseded by the next
+    group, which will see the latest version of its files.
+
+    Args:
+        dir_path (pathlib.Path): the Home Documentation's path
+        apps (builder.SphinxApps, optional): Defaults to None. Warm
+            Sphinx applications to rebuild projects with
+        debounce (float, optional): Defaults to 0.5. Seconds without
+            events to wait for before rebuilding
+        site (home.HomeSite, optional): Defaults to None. Warm mkdocs
+            builds to rebuild the Home Documentation with, rather than
+            running `mkdocs build`
+    """
+
+    def __init__(self, dir_path, apps=None, debounce=0.5, site=None):
+        self.dir_path = dir_path
+        self.apps = apps
+        self.site = site
+        self.debounce = debounce
+        self.pending = set()
+        # {target: time.monotonic() of its first event since its last rebuild}
+        self.edited = {}
+        # Called with each target successfully rebuilt and its `edited` time
+        self.listeners = []
+        self.last_event = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    def notify(self, target):
+        """Mark a target as dirty
+
+        Args:
+            target (str or None): a project or HOME
+        """
+        with self.condition:
+            self.pending.add(target)
+            self.last_event = time.monotonic()
+            self.edited.setdefault(target, self.last_event)
+            self.condition.notify()
+
+    def next_batch(self):
+        """Wait for a quiet period after some events
+
+        Returns:
+            set: the dirty targets, or None if the scheduler was stopped
+        """
+        with self.condition:
+            while not self.stopped:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                remaining = self.last_event + self.debounce - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                batch, self.pending = self.pending, set()
+                return batch
+        return None
+
+    @property
+    def offline(self):
+        return json.loads(os.getenv("MKINX_OFFLINE", "false"))
+
+    def is_superseded(self, target):
+        with self.condition:
+            return target in self.pending
+
+    def pop_edited(self, target):
+        """The time of a target's first event since its last rebuild, which
+        is about to start: events received meanwhile call for another one
+        """
+        with self.condition:
+            return self.edited.pop(target, None)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            tracer = profiling.tracer
+            known = registry.get_registry(self.dir_path).projects
+            projects = sorted(t for t in batch if t is not HOME)
+            for project in projects:
+                if project not in known:
+                    self.pop_edited(project)
+                    continue
+                if self.is_superseded(project):
+                    continue
+                edited = self.pop_edited(project)
+                with tracer.phase("rebuild", project):
+                    rebuilt = self.attempt(
+                        "Rebuilding " + project,
+                        builder.rebuild_project,
+                        project,
+                        self.dir_path,
+                        self.apps,
+                        self.offline,
+                    )
+                if rebuilt:
+                    self.notify_listeners(project, edited)
+            if HOME in batch and not self.is_superseded(HOME):
+                edited = self.pop_edited(HOME)
+                with tracer.phase("rebuild"):
+                    rebuilt = self.attempt(
+                        "Rebuilding the Home Documentation", self.rebuild_home
+                    )
+                if rebuilt:
+                    self.notify_listeners(HOME, edited)
+            with tracer.phase("search index"):
+                self.attempt("Indexing the search", self.rebuild_search_index)
+
+    def attempt(self, description, function, *args):
+        """Run a rebuild step, reporting its errors rather than letting them
+        stop the scheduler's thread
+
+        Args:
+            description (str): the step, for the error message
+            function (callable): the step
+            *args: function's arguments
+
+        Returns:
+            Whatever function returns, or False if it raised an exception
+        """
+        try:
+            return function(*args)
+        except Exception:
+            print(
+                "{}{} failed{}".format(
+                    utils.colors.FAIL, description, utils.colors.ENDC
+                )
+            )
+            traceback.print_exc()
+            return False
+
+    def rebuild_search_index(self):
+        search.build_search_index(self.dir_path)
+        assets.precompress(self.dir_path / SEARCH_DIR, home=self.dir_path)
+
+    def notify_listeners(self, target, edited=None):
+        for listener in self.listeners:
+            listener(target, edited)
+
+    def rebuild_home(self):
+        """Run mkdocs build and precompress the site
+
+        Returns:
+            bool: False if the build failed
+        """
+        tracer = profiling.tracer
+        if self.site is not None:
+            with tracer.phase("mkdocs build"):
+                if not self.site.build():
+                    return False
+        else:
+            try:
+                with tracer.phase("mkdocs build"):
+                    _ = subprocess.check_output(
+                        "mkdocs build > /dev/null", shell=True, cwd=str(self.dir_path)
+                    )
+            except subprocess.CalledProcessError as e:
+                print(e, "\n")
+                return False
+        if self.offline:
+            with tracer.phase("make_offline"):
+                utils.make_offline(self.dir_path)
+        with tracer.phase("precompress"):
+            assets.precompress(self.dir_path / "site", home=self.dir_path)
+        return True
@@ -0,0 +1,317 @@
+# mkinx: Manage sphinx documentations with mkdocs
+# Copyright (C) 2018  Victor Schmidt vsch[at]pm.me
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or 
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import tarfile
+import threading
+from shutil import rmtree
+
+from . import builder, profiling, utils
+from .conf import HTML_LOCATION, WORKER_KEEP
+
+# Messages are a JSON header, prefixed with its length, followed by the
+# header's "size" bytes of payload (a gzipped tar archive):
+#
+#   coordinator -> worker: {"project", "digest", "clean"}
+#   worker -> coordinator: {"source": whether the worker needs the sources}
+#   coordinator -> worker: {"size"} + the project's sources, if needed
+#   worker -> coordinator: {"returncode", "output", "size"} + build/html
+_LENGTH = struct.Struct("!I")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ProtocolError("Connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock, header, payload=b""):
+    """Send a JSON header and its payload"""
+    header = json.dumps(dict(header, size=len(payload))).encode()
+    sock.sendall(_LENGTH.pack(len(header)) + header)
+    if payload:
+        sock.sendall(payload)
+
+
+def receive_message(sock):
+    """Receive a message sent by `send_message`
+
+    Returns:
+        tuple: the header (dict) and the payload (bytes)
+    """
+    (length,) = _LENGTH.unpack(_receive_exactly(sock, _LENGTH.size))
+    try:
+        header = json.loads(_receive_exactly(sock, length).decode())
+    except ValueError:
+        raise ProtocolError("Invalid header")
+    return header, _receive_exactly(sock, header.get("size", 0))
+
+
+def pack(root, paths):
+    """Archive files, named relatively to `root`
+
+    Args:
+        root (pathlib.Path): the archive's root
+        paths (iterable(pathlib.Path)): files in root
+
+    Returns:
+        bytes: a gzipped tar archive
+    """
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz", compresslevel=1) as archive:
+        for path in paths:
+            archive.add(str(path), arcname=os.path.relpath(str(path), str(root)))
+    return data.getvalue()
+
+
+def unpack(data, destination):
+    """Extract an archive made by `pack`, refusing members which are not
+    regular files or directories within `destination`
+    """
+    destination.mkdir(parents=True, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        for member in archive.getmembers():
+            path = os.path.normpath(member.name)
+            if (
+                os.path.isabs(path)
+                or path.split(os.sep)[0] == ".."
+                or not (member.isfile() or member.isdir())
+            ):
+                raise ProtocolError("Unsafe archive member: " + member.name)
+        archive.extractall(str(destination))
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    """Build a project sent by a coordinator (see `WorkerPool`)"""
+
+    def handle(self):
+        try:
+            request, _ = receive_message(self.request)
+            project, digest = request["project"], request["digest"]
+            if not digest.isalnum() or os.sep in project or project.startswith("."):
+                raise ProtocolError("Invalid project or digest")
+            workspace = self.server.workspace / digest
+            has_source = (workspace / ".complete").exists()
+            send_message(self.request, {"source": not has_source})
+            if not has_source:
+                _, payload = receive_message(self.request)
+                rmtree(str(workspace), ignore_errors=True)
+                unpack(payload, workspace / project)
+                (workspace / ".complete").touch()
+            os.utime(str(workspace))
+        except (OSError, ProtocolError, KeyError) as e:
+            print(
+                "{}Invalid request from {}:{} {}".format(
+                    utils.colors.FAIL, self.client_address[0], utils.colors.ENDC, e
+                )
+            )
+            return
+
+        print(
+            "Building {} ({}{})".format(
+                project, digest[:8], ", cached sources" if has_source else ""
+            )
+        )
+        result = builder.build_project(project, workspace, request.get("clean", True))
+        html_path = workspace / project / HTML_LOCATION
+        payload = b""
+        if not result.returncode:
+            payload = pack(html_path, builder._walk_files(html_path))
+        send_message(
+            self.request,
+            {"returncode": result.returncode, "output": result.output},
+            payload,
+        )
+        self.server.prune()
+
+
+class WorkerServer(socketserver.TCPServer):
+    """Serve project builds, one at a time: Sphinx's state is global to
+    the process. Run several workers to build several projects at once.
+
+    The projects' sources are kept in `workspace`, by digest, so that a
+    project whose sources did not change is not sent again.
+
+    Args:
+        address (tuple): (host, port) to listen on
+        workspace (pathlib.Path): the directory sources are kept in
+        keep (int, optional): Defaults to WORKER_KEEP. Number of sources
+            to keep, the least recently built are removed
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, address, workspace, keep=WORKER_KEEP):
+        self.workspace = workspace
+        self.keep = keep
+        self.workspace.mkdir(parents=True, exist_ok=True)
+        super().__init__(address, WorkerHandler)
+
+    def prune(self):
+        entries = sorted(
+            (e for e in os.scandir(str(self.workspace)) if e.is_dir()),
+            key=lambda e: e.stat().st_mtime,
+            reverse=True,
+        )
+        for entry in entries[self.keep :]:
+            rmtree(entry.path, ignore_errors=True)
+
+
+def parse_address(address):
+    """ "host:port" -> (host, port)"""
+    host, _, port = address.strip().rpartition(":")
+    return host or "localhost", int(port)
+
+
+class WorkerPool:
+    """Hand project builds to `mkinx worker` processes, one build per
+    worker at a time. A worker which can't be reached, or which breaks the
+    protocol, is left out of the pool and its build is retried on another
+    one. Failed builds (Sphinx errors...) are not retried.
+
+    Args:
+        addresses (list(str)): the workers' "host:port" addresses
+        timeout (float, optional): Defaults to 600. Seconds without news
+            from a worker before giving up on it
+    """
+
+    def __init__(self, addresses, timeout=600):
+        self.addresses = [parse_address(a) for a in addresses]
+        self.timeout = timeout
+        self.busy = set()
+        self.dead = set()
+        self.condition = threading.Condition()
+
+    def acquire(self, tried):
+        """Wait for an idle worker which was not tried yet
+
+        Returns:
+            tuple: the worker's address, None if every worker was tried
+        """
+        with self.condition:
+            while True:
+                candidates = [
+                    a for a in self.addresses if a not in tried and a not in self.dead
+                ]
+                if not candidates:
+                    return None
+                for address in candidates:
+                    if address not in self.busy:
+                        self.busy.add(address)
+                        return address
+                self.condition.wait()
+
+    def release(self, address, dead=False):
+        with self.condition:
+            self.busy.discard(address)
+            if dead:
+                self.dead.add(address)
+            self.condition.notify_all()
+
+    def send(self, address, project, dir_path, digest, clean):
+        project_path = dir_path / project
+        with socket.create_connection(address, timeout=self.timeout) as sock:
+            send_message(sock, {"project": project, "digest": digest, "clean": clean})
+            header, _ = receive_message(sock)
+            if header.get("source"):
+                sources = pack(project_path, builder.project_files(project_path))
+                send_message(sock, {}, sources)
+            header, payload = receive_message(sock)
+
+        if not header["returncode"]:
+            html_path = project_path / HTML_LOCATION
+            rmtree(str(html_path), ignore_errors=True)
+            unpack(payload, html_path)
+        return builder.BuildResult(project, header["returncode"], header["output"])
+
+    def build(self, project, dir_path, digest=None, clean=True):
+        """Build a project on the first idle worker, retrying on the others
+        if it can't
+
+        Args:
+            project (str): project to build
+            dir_path (pathlib.Path): the Home Documentation's path
+            digest (str, optional): Defaults to None. The digest of the
+                project's inputs (see `builder.BuildManifest`), computed
+                if not provided
+            clean (bool, optional): Defaults to True. See
+                `builder.build_project`
+
+        Returns:
+            builder.BuildResult: the project's build
+        """
+        if digest is None:
+            digest = builder.BuildManifest(dir_path).hash_inputs(
+                project, builder.project_inputs(dir_path / project)
+            )["digest"]
+        tried = set()
+        errors = []
+        while True:
+            address = self.acquire(tried)
+            if address is None:
+                return builder.BuildResult(
+                    project,
+                    1,
+                    "No worker could build {}:\n{}".format(project, "\n".join(errors)),
+                )
+            tried.add(address)
+            begin = profiling.snapshot()
+            try:
+                result = self.send(address, project, dir_path, digest, clean)
+            except (OSError, ProtocolError, KeyError, tarfile.TarError) as e:
+                worker = "{}:{}".format(*address)
+                errors.append("{}: {}".format(worker, e))
+                print(
+                    "{}Worker {} failed{} ({}), retrying {} elsewhere".format(
+                        utils.colors.WARNING, worker, utils.colors.ENDC, e, project
+                    )
+                )
+                self.release(address, dead=True)
+                continue
+            profiling.tracer.record(
+                "remote build", project, begin, profiling.snapshot()
+            )
+            self.release(address)
+            return result
+
+
+def serve(address, workspace):
+    """Run a worker until interrupted
+
+    Args:
+        address (tuple): (host, port) to listen on
+        workspace (pathlib.Path): see `WorkerServer`
+    """
+    server = WorkerServer(address, workspace)
+    print("Worker listening on {}:{}".format(*server.server_address))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
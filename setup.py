@@ -25,7 +25,6 @@ setup(name='mkinx',
           'mkdocs',
           'sphinx_rtd_theme>=0.4.0',
           'mkdocs-material',
-          'pexpect',
           'pygments'
       ],
       )